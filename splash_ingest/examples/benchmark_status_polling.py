@@ -0,0 +1,65 @@
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+
+async def poll_status(
+    client, jobs_url, api_key, job_id, requests_per_client, latencies
+):
+    for _ in range(requests_per_client):
+        start = time.perf_counter()
+        resp = await client.get(f"{jobs_url}/{job_id}", params={"api_key": api_key})
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+
+
+async def run(jobs_url, api_key, job_id, concurrency, requests_per_client):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                poll_status(
+                    client, jobs_url, api_key, job_id, requests_per_client, latencies
+                )
+                for _ in range(concurrency)
+            ]
+        )
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def percentile(latencies, percent):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 6):
+        print("")
+        print(
+            "usage: python benchmark_status_polling.py <url> <api_key> <job_id> "
+            "[<concurrency> <requests_per_client>]"
+        )
+        print("")
+        sys.exit(0)
+
+    jobs_url = sys.argv[1]
+    api_key = sys.argv[2]
+    job_id = sys.argv[3]
+    concurrency = int(sys.argv[4]) if len(sys.argv) == 6 else 50
+    requests_per_client = int(sys.argv[5]) if len(sys.argv) == 6 else 20
+
+    latencies, elapsed = asyncio.run(
+        run(jobs_url, api_key, job_id, concurrency, requests_per_client)
+    )
+    print(f"{len(latencies)} status polls from {concurrency} concurrent clients")
+    print(f"throughput {len(latencies) / elapsed:.1f} requests/s")
+    print(f"p50 {1000 * statistics.median(latencies):.1f} ms")
+    print(f"p90 {1000 * percentile(latencies, 90):.1f} ms")
+    print(f"p99 {1000 * percentile(latencies, 99):.1f} ms")
+    print(f"max {1000 * max(latencies):.1f} ms")
@@ -1,8 +1,7 @@
 import sys
-import time
 
 import requests
-from splash_ingest.server.model import Job, JobStatus
+from splash_ingest.server.model import Job, StatusItem
 
 
 def create_job(url, api_key, mapping_name, file_path):
@@ -20,6 +19,26 @@ def create_job(url, api_key, mapping_name, file_path):
         raise Exception("job creation failed", resp.json()["detail"])
 
 
+def stream_job_statuses(url, api_key, job_id, timeout=300):
+    """Yields each StatusItem of the job until it finishes, from its event stream"""
+    resp = requests.get(
+        url + f"/{job_id}/events",
+        params={"api_key": api_key, "timeout": timeout},
+        stream=True,
+    )
+    if not resp.ok:
+        raise Exception("job status stream failed", resp.json()["detail"])
+    event = None
+    for line in resp.iter_lines(decode_unicode=True):
+        field, _, value = line.partition(": ")
+        if field == "event":
+            event = value
+        elif field == "data" and event == "status":
+            yield StatusItem.parse_raw(value)
+        elif field == "data" and event == "end":
+            return
+
+
 def check_job(url, api_key, job_id) -> Job:
     resp = requests.get(url + f"/{job_id}?api_key={api_key}")
     if resp.ok:
@@ -42,18 +61,11 @@ if __name__ == "__main__":
     h5_file = sys.argv[4]
     job_id = create_job(jobs_url, api_key, mapping_name, h5_file)
 
-    # poll for a change in job status
-    for x in range(0, 60):
-        job = check_job(jobs_url, api_key, job_id)
-        if job.status == JobStatus.submitted or job.status == JobStatus.running:
-            print(f"{job_id} status is {job.status}")
-            time.sleep(3)
-            continue
-        else:
-            print(f"{job_id} job completed process with status {job.status}")
-            for status in job.status_history:
-                print(f"  {status.time} {status.status}")
-                if status.log:
-                    for log in status.log.split("\\n"):
-                        print(f"     {log}")
-            break
+    # the server pushes each status change as it happens
+    for status in stream_job_statuses(jobs_url, api_key, job_id):
+        print(f"  {status.time} {status.status}")
+        if status.log:
+            for log in status.log.split("\\n"):
+                print(f"     {log}")
+    job = check_job(jobs_url, api_key, job_id)
+    print(f"{job_id} job finished with status {job.status}")
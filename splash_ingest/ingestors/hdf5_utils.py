@@ -0,0 +1,167 @@
+from functools import lru_cache
+import itertools
+import logging
+import posixpath
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import h5py
+import numpy as np
+
+from splash_ingest.ingestors.utils import Issue, Severity
+
+logger = logging.getLogger("splash_ingest")
+
+
+def extract_metadata(
+    file: h5py.File, key_lists: Sequence[Sequence[str]], issues: List[Issue]
+) -> List[Dict[str, Any]]:
+    """Reads the datasets named in each list of keys, in a single pass over the file
+
+    Every path is resolved once, even if it appears in several lists, and
+    datasets are read through their parent group, so on network file systems
+    each group is looked up once rather than once per dataset. Returns
+    one dict of values per key list, and adds an issue for each missing key,
+    in the order the keys are listed. A key naming a group rather than a
+    dataset gets the value None and an issue.
+    """
+    missing = object()
+    not_dataset = object()
+    groups = {}
+    values = {}
+    for md_key in dict.fromkeys(key for keys in key_lists for key in keys):
+        parent_path, name = posixpath.split(md_key)
+        group = get_group(file, parent_path, groups)
+        node = group.get(name) if group is not None else None
+        if node is None:
+            values[md_key] = missing
+        elif not isinstance(node, h5py.Dataset):
+            values[md_key] = not_dataset
+        else:
+            values[md_key] = get_dataset_value(node)
+
+    metadata_dicts = []
+    for keys in key_lists:
+        metadata = {}
+        for md_key in keys:
+            if values[md_key] is missing:
+                issues.append(
+                    Issue(msg=f"dataset not found {md_key}", severity=Severity.warning)
+                )
+                continue
+            if values[md_key] is not_dataset:
+                issues.append(
+                    Issue(msg=f"not a dataset {md_key}", severity=Severity.warning)
+                )
+                metadata[md_key] = None
+                continue
+            metadata[md_key] = values[md_key]
+        metadata_dicts.append(metadata)
+    return metadata_dicts
+
+
+def get_group(file: h5py.File, path: str, groups: Dict[str, h5py.Group]):
+    """Returns the group at path, or None, caching it and its parents in groups"""
+    # each group is opened from its already opened parent, so is resolved once
+    if path in groups:
+        return groups[path]
+    if path in ("", "/"):
+        group = file
+    else:
+        parent_path, name = posixpath.split(path)
+        parent = get_group(file, parent_path, groups)
+        group = parent.get(name) if parent is not None else None
+        if not isinstance(group, h5py.Group):
+            group = None
+    groups[path] = group
+    return group
+
+
+@lru_cache(maxsize=None)
+def dataset_reader(dtype: str, shape: tuple) -> Callable:
+    """Returns the function that reads datasets of this dtype and shape"""
+    if "S" in dtype:
+        if shape == (1,):
+            return lambda data_set: data_set.asstr()[0]
+        if shape == ():
+            return lambda data_set: data_set[()].decode("utf-8")
+        return lambda data_set: list(data_set.asstr())
+    if shape in ((0,), (1,)):
+        # only these shapes fit a maxshape of (1,), so only they need to look at it
+        return lambda data_set: (
+            data_set[()][0] if data_set.maxshape == (1,) else data_set[()]
+        )
+    return lambda data_set: data_set[()]
+
+
+def get_dataset_value(data_set: h5py.Dataset):
+    try:
+        reader = dataset_reader(data_set.dtype.str, data_set.shape)
+        return reader(data_set)
+    except Exception:
+        logger.exception("Exception extracting dataset value")
+        return None
+
+
+def get_data_sample(file: h5py.File, keys: Sequence[str], sample_size=10):
+    data_sample = {}
+    bytes_read = 0
+    for key in keys:
+        data_array = file.get(key)
+        if not data_array:
+            continue
+        data_sample[key], dataset_bytes = sample_dataset(data_array, sample_size)
+        bytes_read += dataset_bytes
+    logger.debug(f"sampled {len(data_sample)} datasets reading {bytes_read} bytes")
+    return data_sample
+
+
+def sample_dataset(data_set: h5py.Dataset, sample_size=10) -> Tuple[np.ndarray, int]:
+    """Reads evenly spaced rows of a dataset, returning them and the bytes read
+
+    The rows are data_set[0::len // sample_size]. Of a chunked dataset, only
+    the chunks holding those rows are read, each run of neighbouring chunks
+    in one contiguous read, so sampling a long, compressed time series reads
+    a few chunks rather than all of it. Bytes are counted as stored, so
+    after compression.
+    """
+    length = len(data_set)
+    step_size = max(int(length / sample_size), 1)
+    if data_set.chunks is None or length == 0:
+        sample = data_set[0::step_size]
+        return sample, sample.nbytes
+
+    chunk_rows = data_set.chunks[0]
+    parts = []
+    bytes_read = 0
+    for first_row, last_row in _chunk_runs(length, step_size, chunk_rows):
+        stop = last_row + 1
+        parts.append(data_set[first_row:stop][::step_size])
+        bytes_read += sum(
+            _chunk_row_bytes(data_set, chunk)
+            for chunk in range(first_row // chunk_rows, last_row // chunk_rows + 1)
+        )
+    return np.concatenate(parts), bytes_read
+
+
+def _chunk_runs(length: int, step_size: int, chunk_rows: int):
+    """Yields the first and last sampled rows of each run of neighbouring chunks"""
+    first_row = last_row = 0
+    for row in range(step_size, length, step_size):
+        if row // chunk_rows > last_row // chunk_rows + 1:
+            yield first_row, last_row
+            first_row = row
+        last_row = row
+    yield first_row, last_row
+
+
+def _chunk_row_bytes(data_set: h5py.Dataset, chunk: int) -> int:
+    """Stored size of the chunks at the given position along the first axis"""
+    offsets = itertools.product(
+        [chunk * data_set.chunks[0]],
+        *(
+            range(0, dim, rows)
+            for dim, rows in zip(data_set.shape[1:], data_set.chunks[1:])
+        ),
+    )
+    # chunks that were never written take no space, and are read as the fill value
+    return sum(data_set.id.get_chunk_info_by_coord(offset).size for offset in offsets)
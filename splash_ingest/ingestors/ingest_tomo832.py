@@ -1,28 +1,28 @@
-from datetime import datetime
 import json
 import logging
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Dict, List, Optional
 
 import h5py
 from pyscicat.client import ScicatClient
 from pyscicat.model import (
-    Attachment,
-    Datablock,
-    DataFile,
     RawDataset,
     DatasetType,
     Ownable,
 )
 
+from splash_ingest.ingestors.hdf5_utils import extract_metadata, get_data_sample
 from splash_ingest.ingestors.scicat_utils import (
     build_search_terms,
-    build_thumbnail,
     calculate_access_controls,
-    encode_image_2_thumbnail,
+    create_thumbnail,
+    get_file_mod_time,
+    get_file_size,
     NPArrayEncoder,
+    upload_attachment,
+    upload_data_block,
 )
-from splash_ingest.ingestors.utils import Issue, Severity
+from splash_ingest.ingestors.utils import Issue, stage
 
 ingest_spec = "als832_dx_3"
 
@@ -33,17 +33,21 @@ def ingest(
     scicat_client: ScicatClient,
     username: str,
     file_path: str,
-    thumbnail_dir: Path,
+    thumbnail_dir: Optional[Path],
     issues: List[Issue],
 ) -> str:
-    with h5py.File(file_path, "r") as file:
+    with stage("open_hdf5"):
+        file = h5py.File(file_path, "r")
+    with file:
         file_path = Path(file_path)
-        scicat_metadata = _extract_fields(file, scicat_metadata_keys, issues)
-        scientific_metadata = _extract_fields(file, scientific_metadata_keys, issues)
-        scientific_metadata["data_sample"] = _get_data_sample(file)
-        encoded_scientific_metadata = json.loads(
-            json.dumps(scientific_metadata, cls=NPArrayEncoder)
-        )
+        with stage("extract_metadata"):
+            scicat_metadata, scientific_metadata = extract_metadata(
+                file, [scicat_metadata_keys, scientific_metadata_keys], issues
+            )
+            scientific_metadata["data_sample"] = _get_data_sample(file)
+            encoded_scientific_metadata = json.loads(
+                json.dumps(scientific_metadata, cls=NPArrayEncoder)
+            )
         access_controls = calculate_access_controls(
             username,
             scicat_metadata.get("/measurement/sample/experiment/beamline"),
@@ -58,18 +62,23 @@ def ingest(
             ownerGroup=access_controls["owner_group"],
             accessGroups=access_controls["access_groups"],
         )
-        dataset_id = upload_raw_dataset(
-            scicat_client,
-            file_path,
-            scicat_metadata,
-            encoded_scientific_metadata,
-            ownable,
-        )
-        upload_data_block(scicat_client, file_path, dataset_id, ownable)
+        with stage("upload_dataset"):
+            dataset_id = upload_raw_dataset(
+                scicat_client,
+                file_path,
+                scicat_metadata,
+                encoded_scientific_metadata,
+                ownable,
+            )
+        with stage("upload_datablock"):
+            upload_data_block(scicat_client, file_path, dataset_id, ownable)
 
-        thumbnail_file = build_thumbnail(file["/exchange/data"][0], thumbnail_dir)
-        encoded_thumbnail = encode_image_2_thumbnail(thumbnail_file)
-        upload_attachment(scicat_client, encoded_thumbnail, dataset_id, ownable)
+        with stage("build_thumbnail"):
+            encoded_thumbnail = create_thumbnail(
+                file["/exchange/data"], file_path, thumbnail_dir
+            )
+        with stage("upload_attachment"):
+            upload_attachment(scicat_client, encoded_thumbnail, dataset_id, ownable)
 
         return dataset_id
 
@@ -116,106 +125,8 @@ def upload_raw_dataset(
     return dataset_id
 
 
-def create_data_files(file_path: Path) -> List[DataFile]:
-    "Collects all fits files"
-    datafiles = []
-    datafile = DataFile(
-        path=file_path.name,
-        size=get_file_size(file_path),
-        time=get_file_mod_time(file_path),
-        type="RawDatasets",
-    )
-    datafiles.append(datafile)
-    return datafiles
-
-
-def upload_data_block(
-    scicat_client: ScicatClient, file_path: Path, dataset_id: str, ownable: Ownable
-) -> Datablock:
-    "Creates a datablock of fits files"
-    datafiles = create_data_files(file_path)
-
-    datablock = Datablock(
-        datasetId=dataset_id,
-        size=get_file_size(file_path),
-        dataFileList=datafiles,
-        **ownable.dict(),
-    )
-    scicat_client.upload_datablock(datablock)
-
-
-def upload_attachment(
-    scicat_client: ScicatClient,
-    encoded_thumnbnail: str,
-    dataset_id: str,
-    ownable: Ownable,
-) -> Attachment:
-    "Creates a thumbnail png"
-    attachment = Attachment(
-        datasetId=dataset_id,
-        thumbnail=encoded_thumnbnail,
-        caption="raw image",
-        **ownable.dict(),
-    )
-    scicat_client.upload_attachment(attachment)
-
-
-def get_file_size(file_path: Path) -> int:
-    return file_path.lstat().st_size
-
-
-def get_file_mod_time(file_path: Path) -> str:
-    return str(datetime.fromtimestamp(file_path.lstat().st_mtime))
-
-
-def _extract_fields(file, keys, issues) -> Dict[str, Any]:
-    metadata = {}
-    for md_key in keys:
-        dataset = file.get(md_key)
-        if not dataset:
-            issues.append(
-                Issue(msg=f"dataset not found {md_key}", severity=Severity.warning)
-            )
-            continue
-        metadata[md_key] = _get_dataset_value(file[md_key])
-    return metadata
-
-
-def _get_dataset_value(data_set):
-    logger.debug(f"{data_set}  {data_set.dtype}")
-    try:
-        if "S" in data_set.dtype.str:
-            if data_set.shape == (1,):
-                return data_set.asstr()[0]
-            elif data_set.shape == ():
-                return data_set[()].decode("utf-8")
-            else:
-                return list(data_set.asstr())
-        else:
-            if data_set.maxshape == (1,):
-                logger.debug(f"{data_set}  {data_set[()][0]}")
-                return data_set[()][0]
-            else:
-                logger.debug(f"{data_set}  {data_set[()]}")
-                return data_set[()]
-    except Exception:
-        logger.exception("Exception extracting dataset value")
-        return None
-
-
 def _get_data_sample(file, sample_size=10):
-    data_sample = {}
-    for key in data_sample_keys:
-        data_array = file.get(key)
-        if not data_array:
-            continue
-        step_size = int(len(data_array) / sample_size)
-        if step_size == 0:
-            step_size = 1
-        sample = data_array[0::step_size]
-        data_sample[key] = sample
-
-    return data_sample
+    return get_data_sample(file, data_sample_keys, sample_size)
 
 
 scicat_metadata_keys = [
@@ -0,0 +1,236 @@
+from dataclasses import dataclass, field
+from hashlib import sha256
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import h5py
+from pyscicat.client import ScicatClient
+from pyscicat.model import DatasetType, Ownable, RawDataset
+
+from splash_ingest.ingestors.hdf5_utils import extract_metadata, get_data_sample
+from splash_ingest.ingestors.scicat_utils import (
+    build_search_terms,
+    calculate_access_controls,
+    create_thumbnail,
+    get_file_mod_time,
+    get_file_size,
+    NPArrayEncoder,
+    upload_attachment,
+    upload_data_block,
+)
+from splash_ingest.ingestors.utils import Issue, stage
+
+logger = logging.getLogger("splash_ingest")
+
+DEFAULT_SAMPLE_SIZE = 10
+
+
+@dataclass
+class ExtractionPlan:
+    """Everything an ingest needs from a mapping document, resolved ahead of time
+
+    scicat_fields maps RawDataset fields, plus beamline for access
+    controls, to the HDF5 paths they are read from. Their paths are part
+    of metadata_keys.
+    """
+
+    name: str
+    version: str
+    digest: str
+    metadata_keys: Tuple[str, ...]
+    scientific_keys: Tuple[str, ...]
+    sample_keys: Tuple[str, ...]
+    sample_size: int = DEFAULT_SAMPLE_SIZE
+    thumbnail_field: Optional[str] = None
+    scicat_fields: Dict[str, str] = field(default_factory=dict)
+    data_format: Optional[str] = None
+
+
+def _unique(keys) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(keys))
+
+
+def compile_plan(mapping: dict, digest: str) -> ExtractionPlan:
+    """Resolves a mapping document into the paths an ingest reads
+
+    Configuration fields of every stream become scientific metadata and
+    event fields become data samples, except external ones like detector
+    images, which are only used for the thumbnail.
+    """
+    scicat = mapping.get("scicat") or {}
+    scicat_fields = scicat.get("fields") or {}
+    metadata_keys = [
+        md_mapping["field"] for md_mapping in mapping.get("md_mappings") or []
+    ]
+    scientific_keys = []
+    sample_keys = []
+    thumbnail_field = None
+    for stream_mapping in (mapping.get("stream_mappings") or {}).values():
+        for conf_mapping in stream_mapping.get("conf_mappings") or []:
+            scientific_keys.extend(
+                mapping_field["field"]
+                for mapping_field in conf_mapping.get("mapping_fields") or []
+            )
+        sample_keys.extend(
+            mapping_field["field"]
+            for mapping_field in stream_mapping.get("mapping_fields") or []
+            if not mapping_field.get("external")
+        )
+        thumbnail_info = stream_mapping.get("thumbnail_info")
+        if thumbnail_info and not thumbnail_field:
+            thumbnail_field = thumbnail_info["field"]
+    return ExtractionPlan(
+        name=mapping["name"],
+        version=mapping.get("version"),
+        digest=digest,
+        metadata_keys=_unique([*metadata_keys, *scicat_fields.values()]),
+        scientific_keys=_unique(scientific_keys),
+        sample_keys=_unique(sample_keys),
+        sample_size=mapping.get("sample_size") or DEFAULT_SAMPLE_SIZE,
+        thumbnail_field=thumbnail_field,
+        scicat_fields=scicat_fields,
+        data_format=scicat.get("data_format"),
+    )
+
+
+# compiled plans by (name, version, digest), shared by every ingestor in the process
+_plans: Dict[Tuple[str, str, str], ExtractionPlan] = {}
+_plans_lock = threading.Lock()
+
+
+def load_plan(mapping_path: Path) -> ExtractionPlan:
+    """Returns the compiled plan of a mapping file, compiling it only the first time"""
+    document = Path(mapping_path).read_bytes()
+    digest = sha256(document).hexdigest()
+    mapping = json.loads(document)
+    key = (mapping["name"], mapping.get("version"), digest)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is None:
+            plan = compile_plan(mapping, digest)
+            _plans[key] = plan
+            logger.info(f"compiled mapping {plan.name} version {plan.version}")
+    return plan
+
+
+class MappingIngestor:
+    """Ingests HDF5 files described by a mapping document, with no beamline specific code
+
+    The mapping is reloaded only when its file changes, and then only
+    recompiled if its name, version or contents are new.
+    """
+
+    def __init__(self, mapping_path: Path):
+        self.mapping_path = Path(mapping_path)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._plan = None
+        self.ingest_spec = self.plan().name
+
+    def plan(self) -> ExtractionPlan:
+        mtime = os.stat(self.mapping_path).st_mtime_ns
+        with self._lock:
+            if mtime != self._mtime:
+                self._plan = load_plan(self.mapping_path)
+                self._mtime = mtime
+            return self._plan
+
+    def ingest(
+        self,
+        scicat_client: ScicatClient,
+        username: str,
+        file_path: str,
+        thumbnail_dir: Optional[Path],
+        issues: List[Issue],
+    ) -> str:
+        plan = self.plan()
+        with stage("open_hdf5"):
+            file = h5py.File(file_path, "r")
+        with file:
+            file_path = Path(file_path)
+            with stage("extract_metadata"):
+                scicat_metadata, scientific_metadata = extract_metadata(
+                    file, [plan.metadata_keys, plan.scientific_keys], issues
+                )
+                scientific_metadata["data_sample"] = get_data_sample(
+                    file, plan.sample_keys, plan.sample_size
+                )
+                encoded_scientific_metadata = json.loads(
+                    json.dumps(scientific_metadata, cls=NPArrayEncoder)
+                )
+            dataset_fields = {
+                name: scicat_metadata.get(path)
+                for name, path in plan.scicat_fields.items()
+            }
+            access_controls = calculate_access_controls(
+                username,
+                dataset_fields.pop("beamline", None),
+                dataset_fields.get("proposalId"),
+            )
+            ownable = Ownable(
+                ownerGroup=access_controls["owner_group"],
+                accessGroups=access_controls["access_groups"],
+            )
+            with stage("upload_dataset"):
+                dataset_id = upload_raw_dataset(
+                    scicat_client,
+                    file_path,
+                    plan,
+                    dataset_fields,
+                    encoded_scientific_metadata,
+                    ownable,
+                )
+            with stage("upload_datablock"):
+                upload_data_block(scicat_client, file_path, dataset_id, ownable)
+
+            if plan.thumbnail_field and file.get(plan.thumbnail_field):
+                with stage("build_thumbnail"):
+                    encoded_thumbnail = create_thumbnail(
+                        file[plan.thumbnail_field], file_path, thumbnail_dir
+                    )
+                with stage("upload_attachment"):
+                    upload_attachment(
+                        scicat_client, encoded_thumbnail, dataset_id, ownable
+                    )
+
+            return dataset_id
+
+
+def upload_raw_dataset(
+    scicat_client: ScicatClient,
+    file_path: Path,
+    plan: ExtractionPlan,
+    dataset_fields: Dict,
+    scientific_metadata: Dict,
+    ownable: Ownable,
+) -> str:
+    "Creates a dataset object from the fields the mapping names"
+    dataset_name = dataset_fields.pop("datasetName", None) or file_path.stem
+    description = build_search_terms(dataset_name)
+    dataset = RawDataset(
+        **{
+            "owner": "Unknown",
+            "contactEmail": "Unknown",
+            "creationLocation": "Unknown",
+            "instrumentId": "Unknown",
+            "principalInvestigator": "Unknown",
+            **{name: value for name, value in dataset_fields.items() if value},
+        },
+        datasetName=dataset_name,
+        type=DatasetType.raw,
+        dataFormat=plan.data_format,
+        sourceFolder=str(file_path.parent),
+        size=get_file_size(file_path),
+        scientificMetadata=scientific_metadata,
+        sampleId=description,
+        isPublished=False,
+        description=description,
+        keywords=description.split(),
+        creationTime=get_file_mod_time(file_path),
+        **ownable.dict(),
+    )
+    return scicat_client.upload_raw_dataset(dataset)
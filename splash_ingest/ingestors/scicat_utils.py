@@ -1,14 +1,21 @@
 import base64
+from datetime import datetime
+from hashlib import sha256
+import io
 import json
 import logging
+import os
 from pathlib import Path
 import re
-from typing import Dict
+import threading
+from typing import Dict, List, Optional
 from uuid import uuid4
 
+import h5py
 import numpy as np
-import numpy.typing as npt
 from PIL import Image, ImageOps
+from pyscicat.client import ScicatClient
+from pyscicat.model import Attachment, Datablock, DataFile, Ownable
 
 logger = logging.getLogger("splash_ingest")
 can_debug = logger.isEnabledFor(logging.DEBUG)
@@ -53,24 +60,169 @@ def build_search_terms(sample_name):
     return " ".join(description)
 
 
-def encode_image_2_thumbnail(filename, imType="jpg"):
-    logging.info(f"Creating thumbnail for dataset: {filename}")
-    header = "data:image/{imType};base64,".format(imType=imType)
-    with open(filename, "rb") as f:
-        data = f.read()
-    dataBytes = base64.b64encode(data)
-    dataStr = dataBytes.decode("UTF-8")
-    return header + dataStr
+# longest side of a thumbnail, frames are strided down to fit
+THUMBNAIL_SIZE = 512
+# thumbnails kept in the thumbnail directory, the least recently used are removed
+THUMBNAIL_CACHE_FILES = 1000
 
+# frames are read into a float32 buffer per thread, reused while the size is the same
+_frame_buffers = threading.local()
 
-def build_thumbnail(image_array: npt.ArrayLike, thumbnail_dir: Path):
-    image_array = image_array - np.min(image_array) + 1.001
-    image_array = np.log(image_array)
-    image_array = 205 * image_array / (np.max(image_array))
-    auto_contrast_image = Image.fromarray(image_array.astype("uint8"))
+
+def create_thumbnail(
+    data_set: h5py.Dataset, file_path: Path, thumbnail_dir: Optional[Path] = None
+) -> str:
+    """Returns the first frame of an image stack as a base64 encoded PNG data URL
+
+    With a thumbnail_dir, thumbnails are cached there by file, so retried
+    ingests don't build them again.
+    """
+    cache = ThumbnailCache(thumbnail_dir) if thumbnail_dir else None
+    key = cache.key(file_path, data_set.name) if cache else None
+    png = cache.get(key) if cache else None
+    if png is None:
+        png = build_thumbnail(read_thumbnail_frame(data_set))
+        if cache:
+            cache.put(key, png)
+    return encode_thumbnail(png)
+
+
+def read_thumbnail_frame(
+    data_set: h5py.Dataset, max_size: int = THUMBNAIL_SIZE
+) -> np.ndarray:
+    """Reads every nth pixel of the first frame, so that no side is longer than max_size
+
+    The pixels are converted to float32 by HDF5 as they are read, straight
+    into a buffer that is reused by the next read of the same size.
+    """
+    height, width = data_set.shape[-2:]
+    step_y = -(-height // max_size)
+    step_x = -(-width // max_size)
+    shape = (-(-height // step_y), -(-width // step_x))
+    buffer = getattr(_frame_buffers, "buffer", None)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, dtype=np.float32)
+        _frame_buffers.buffer = buffer
+    first_frame = (0,) * (data_set.ndim - 2)
+    data_set.read_direct(buffer, source_sel=first_frame + np.s_[::step_y, ::step_x])
+    return buffer
+
+
+def build_thumbnail(frame: np.ndarray) -> bytes:
+    """Log scales and auto contrasts a frame into PNG bytes, scaling the frame in place"""
+    frame -= np.min(frame)
+    frame += 1.001
+    np.log(frame, out=frame)
+    frame *= 205 / np.max(frame)
+    auto_contrast_image = Image.fromarray(frame.astype(np.uint8))
     auto_contrast_image = ImageOps.autocontrast(auto_contrast_image, cutoff=0.1)
-    filename = str(uuid4()) + ".png"
-    # file = io.BytesIO()
-    file = thumbnail_dir / Path(filename)
+    file = io.BytesIO()
     auto_contrast_image.save(file, format="PNG")
-    return file
+    return file.getvalue()
+
+
+def encode_thumbnail(png: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(png).decode("UTF-8")
+
+
+class ThumbnailCache:
+    """PNG thumbnails in a directory, bounded to the most recently used max_files
+
+    Entries are keyed by the data file's path, size and modification time,
+    so a file that is written again gets a new thumbnail. Several pollers
+    can share the directory, as files are written atomically and removing
+    one that is already gone is ignored.
+    """
+
+    def __init__(self, directory: Path, max_files: int = THUMBNAIL_CACHE_FILES):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(file_path: Path, field: str) -> str:
+        stat = Path(file_path).stat()
+        source = (
+            f"{Path(file_path).resolve()}:{field}:{stat.st_size}:{stat.st_mtime_ns}"
+        )
+        return sha256(source.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.directory / f"{key}.png"
+        try:
+            png = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return png
+
+    def put(self, key: str, png: bytes):
+        temp_path = self.directory / f".{key}.{uuid4()}.tmp"
+        temp_path.write_bytes(png)
+        os.replace(temp_path, self.directory / f"{key}.png")
+        self._evict()
+
+    def _evict(self):
+        files = []
+        for path in self.directory.glob("*.png"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, path in files[: len(files) - self.max_files]:
+            path.unlink(missing_ok=True)
+
+
+def create_data_files(file_path: Path) -> List[DataFile]:
+    "Collects all fits files"
+    datafiles = []
+    datafile = DataFile(
+        path=file_path.name,
+        size=get_file_size(file_path),
+        time=get_file_mod_time(file_path),
+        type="RawDatasets",
+    )
+    datafiles.append(datafile)
+    return datafiles
+
+
+def upload_data_block(
+    scicat_client: ScicatClient, file_path: Path, dataset_id: str, ownable: Ownable
+) -> Datablock:
+    "Creates a datablock of fits files"
+    datafiles = create_data_files(file_path)
+
+    datablock = Datablock(
+        datasetId=dataset_id,
+        size=get_file_size(file_path),
+        dataFileList=datafiles,
+        **ownable.dict(),
+    )
+    scicat_client.upload_datablock(datablock)
+
+
+def upload_attachment(
+    scicat_client: ScicatClient,
+    encoded_thumnbnail: str,
+    dataset_id: str,
+    ownable: Ownable,
+) -> Attachment:
+    "Creates a thumbnail png"
+    attachment = Attachment(
+        datasetId=dataset_id,
+        thumbnail=encoded_thumnbnail,
+        caption="raw image",
+        **ownable.dict(),
+    )
+    scicat_client.upload_attachment(attachment)
+
+
+def get_file_size(file_path: Path) -> int:
+    return file_path.lstat().st_size
+
+
+def get_file_mod_time(file_path: Path) -> str:
+    return str(datetime.fromtimestamp(file_path.lstat().st_mtime))
@@ -1,6 +1,9 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, Union
+import time
+from typing import List, Optional, Union
 
 
 class Severity(str, Enum):
@@ -13,3 +16,72 @@ class Issue:
     severity: Severity
     msg: str
     exception: Optional[Union[str, None]] = None
+
+
+@dataclass
+class StageTiming:
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+
+
+class StageTimer:
+    """Records how long each stage of an ingest takes
+
+    Wall time shows where an ingest waits, for example on NFS or SciCat, and
+    CPU time of the calling thread shows where it computes. Stages run while
+    the timer is active can be recorded from anywhere with `stage`.
+    """
+
+    def __init__(self):
+        self.timings: List[StageTiming] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.timings.append(
+                StageTiming(
+                    name=name,
+                    wall_seconds=time.perf_counter() - wall_start,
+                    cpu_seconds=time.thread_time() - cpu_start,
+                )
+            )
+
+    @contextmanager
+    def activate(self):
+        token = _active_timer.set(self)
+        try:
+            yield self
+        finally:
+            _active_timer.reset(token)
+
+    def summary(self) -> str:
+        """One line per stage, slowest first"""
+        lines = [
+            f"{timing.name}: {timing.wall_seconds:.3f}s wall, {timing.cpu_seconds:.3f}s cpu"
+            for timing in sorted(
+                self.timings, key=lambda timing: timing.wall_seconds, reverse=True
+            )
+        ]
+        return "\n".join(lines)
+
+
+# context variables are per thread, so concurrent ingests each see their own timer
+_active_timer: ContextVar[Optional[StageTimer]] = ContextVar(
+    "stage_timer", default=None
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as a stage of the active StageTimer, if there is one"""
+    timer = _active_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
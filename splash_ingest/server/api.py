@@ -1,23 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from hashlib import sha256
 import logging
-from typing import Optional, List
+import time
+from typing import Dict, Optional, List, Set
 
-from fastapi import Security, Depends, FastAPI, HTTPException
+from fastapi import Header, Security, Depends, FastAPI, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security.api_key import APIKeyQuery, APIKeyCookie, APIKeyHeader, APIKey
 from pydantic import BaseModel, Field
 from pymongo import MongoClient
 from starlette.config import Config
-from starlette.status import HTTP_403_FORBIDDEN
+from starlette.datastructures import CommaSeparatedStrings
+import zmq
+from starlette.status import (
+    HTTP_304_NOT_MODIFIED,
+    HTTP_403_FORBIDDEN,
+    HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+)
 
-from splash_ingest.server.api_auth_service import init_api_service, verify_api_key
+from splash_ingest.server.api_auth_service import (
+    APIClient,
+    init_api_service,
+    verify_api_key,
+)
+from splash_ingest.server.job_notifications import JobNotifier
 from splash_ingest.server.ingest_service import (
     init_ingest_service,
     create_job,
+    create_jobs,
+    file_dedup_key,
     find_job,
+    find_job_statuses,
+    find_modified_times,
+    find_new_status_items,
+    find_or_create_job,
+    find_poller_stats,
     find_unstarted_jobs,
+    FINISHED_STATUSES,
+    InvalidCursorError,
     JobNotFoundError,
+    jobs_modified_since,
+    query_jobs,
 )
 
-from .model import Job, IngestType
+from .model import (
+    DedupMode,
+    Job,
+    JobPage,
+    JobStatus,
+    JobStatusSummary,
+    IngestType,
+    PollerStats,
+    StatusItem,
+)
 
 API_KEY_NAME = "api_key"
 INGEST_JOBS_API = "ingest_jobs"
@@ -36,6 +74,28 @@ INGEST_DB_URI = config(
 )
 INGEST_DB_NAME = config("INGEST_DB_NAME", cast=str, default="ingest")
 INGEST_LOG_LEVEL = config("INGEST_LOG_LEVEL", cast=str, default="INFO")
+# pymongo blocks, so the api runs its database calls on a bounded thread pool
+INGEST_DB_MAX_POOL_SIZE = config("INGEST_DB_MAX_POOL_SIZE", cast=int, default=100)
+INGEST_DB_THREADS = config("INGEST_DB_THREADS", cast=int, default=32)
+# threads that stat or hash submitted files for dedup keys, kept apart from the db threads
+INGEST_FILE_THREADS = config("INGEST_FILE_THREADS", cast=int, default=4)
+# how often a job event stream checks the job for new statuses
+INGEST_EVENTS_POLL_SECONDS = config(
+    "INGEST_EVENTS_POLL_SECONDS", cast=float, default=1.0
+)
+# zmq addresses of the pollers to publish job submissions to, e.g. tcp://ingest-poller:5556.
+# Unset disables notifications
+INGEST_NOTIFY_URIS = config(
+    "INGEST_NOTIFY_URIS", cast=CommaSeparatedStrings, default=""
+)
+INGEST_API_KEY_CACHE_SIZE = config("INGEST_API_KEY_CACHE_SIZE", cast=int, default=1024)
+INGEST_API_KEY_CACHE_SECONDS = config(
+    "INGEST_API_KEY_CACHE_SECONDS", cast=int, default=300
+)
+# fair share weight of each mapping, e.g. "als_733_live=4,als_733_backfill=0.25"
+INGEST_MAPPING_WEIGHTS = config(
+    "INGEST_MAPPING_WEIGHTS", cast=CommaSeparatedStrings, default=""
+)
 
 logger = logging.getLogger("splash_ingest.api_auth")
 
@@ -55,6 +115,26 @@ def init_logging():
 
 init_logging()
 
+db_executor = ThreadPoolExecutor(max_workers=INGEST_DB_THREADS, thread_name_prefix="db")
+
+
+file_executor = ThreadPoolExecutor(
+    max_workers=INGEST_FILE_THREADS, thread_name_prefix="file"
+)
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """Runs a blocking database call without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+
+async def run_in_file_executor(func, *args, **kwargs):
+    """Runs blocking file I/O, which can take minutes, without tying up database threads"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(file_executor, partial(func, *args, **kwargs))
+
+
 app = FastAPI(
     openapi_url="/api/ingest/openapi.json",
     docs_url="/api/ingest/docs",
@@ -62,17 +142,53 @@ app = FastAPI(
 )
 
 
+def parse_mapping_weights(weights: List[str]) -> Dict[str, float]:
+    mapping_weights = {}
+    for weight in weights:
+        mapping_id, _, value = weight.partition("=")
+        mapping_weights[mapping_id.strip()] = float(value)
+    return mapping_weights
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("starting api server")
     logger.info(f"INGEST_DB_URI {INGEST_DB_URI}")
     logger.info(f"INGEST_DB_NAME {INGEST_DB_NAME}")
-    ingest_db = MongoClient(INGEST_DB_URI)[INGEST_DB_NAME]
-    init_ingest_service(ingest_db)
-    init_api_service(ingest_db)
+    logger.info(f"INGEST_NOTIFY_URIS {INGEST_NOTIFY_URIS}")
+    logger.info(f"INGEST_DB_MAX_POOL_SIZE {INGEST_DB_MAX_POOL_SIZE}")
+    logger.info(f"INGEST_DB_THREADS {INGEST_DB_THREADS}")
+    logger.info(f"INGEST_FILE_THREADS {INGEST_FILE_THREADS}")
+    logger.info(f"INGEST_MAPPING_WEIGHTS {INGEST_MAPPING_WEIGHTS}")
+    ingest_db = MongoClient(INGEST_DB_URI, maxPoolSize=INGEST_DB_MAX_POOL_SIZE)[
+        INGEST_DB_NAME
+    ]
+    job_notifier = None
+    if INGEST_NOTIFY_URIS:
+        try:
+            job_notifier = JobNotifier(INGEST_NOTIFY_URIS)
+        except zmq.ZMQError:
+            # pollers still find jobs by polling mongo
+            logger.exception("could not connect job notifications, continuing without")
+    init_ingest_service(
+        ingest_db,
+        job_notifier=job_notifier,
+        mapping_weights=parse_mapping_weights(INGEST_MAPPING_WEIGHTS),
+    )
+    init_api_service(
+        ingest_db,
+        key_cache_size=INGEST_API_KEY_CACHE_SIZE,
+        key_cache_seconds=INGEST_API_KEY_CACHE_SECONDS,
+    )
     # start_job_poller()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    db_executor.shutdown(wait=False)
+    file_executor.shutdown(wait=False)
+
+
 async def get_api_key_from_request(
     api_key_query: str = Security(api_key_query),
     api_key_header: str = Security(api_key_header),
@@ -91,17 +207,58 @@ async def get_api_key_from_request(
         )
 
 
+async def verify_client(api_key: str) -> APIClient:
+    client_key = await run_in_db_executor(verify_api_key, api_key)
+    if not client_key:
+        logger.info("forbidden  {api_key}")
+        raise HTTPException(status_code=403)
+    return client_key
+
+
+MIN_PRIORITY = -10
+MAX_PRIORITY = 10
+
+
 class CreateJobRequest(BaseModel):
     file_path: str = Field(description="path to where file to ingest is located")
     mapping_name: str = Field(
         description="mapping name, used to find mapping file in database"
     )
     ingest_types: List[IngestType] = Field(description="Type of ingestions to be done")
+    dedup: DedupMode = Field(
+        DedupMode.none,
+        description="collapse onto an existing job for the same file, identified "
+        "by path, size and modification time (file) or by a hash of its bytes (content)",
+    )
+    dedup_key: Optional[str] = Field(
+        None,
+        description="caller's own key for the file, e.g. a checksum, used instead of dedup",
+    )
+    priority: int = Field(
+        0,
+        ge=MIN_PRIORITY,
+        le=MAX_PRIORITY,
+        description="jobs with higher priority are run first, e.g. for live acquisitions",
+    )
 
 
 class CreateJobResponse(BaseModel):
     message: str = Field(description="return message")
     job_id: Optional[str] = Field(description="uid of newly created job, if created")
+    coalesced: bool = Field(
+        False, description="true if job_id is an existing job for the same file"
+    )
+
+
+async def _dedup_key(request: CreateJobRequest) -> Optional[str]:
+    if request.dedup_key:
+        return f"{request.mapping_name}:{request.dedup_key}"
+    if request.dedup == DedupMode.none:
+        return None
+    # stats, or for content hashes reads, the whole file
+    return await run_in_file_executor(
+        file_dedup_key, request.mapping_name, request.file_path, request.dedup
+    )
 
 
 @app.post(
@@ -112,15 +269,209 @@ class CreateJobResponse(BaseModel):
 async def submit_job(
     request: CreateJobRequest, api_key: APIKey = Depends(get_api_key_from_request)
 ) -> CreateJobResponse:
-    client_key: APIKey = verify_api_key(api_key)
-    if not client_key:
-        logger.info("forbidden  {api_key}")
-        raise HTTPException(status_code=403)
+    client_key = await verify_client(api_key)
+    if request.dedup == DedupMode.none and not request.dedup_key:
+        job = await run_in_db_executor(
+            create_job,
+            client_key.client,
+            request.file_path,
+            request.mapping_name,
+            request.ingest_types,
+            request.priority,
+        )
+        return CreateJobResponse(message="success", job_id=job.id)
+    dedup_key = await _dedup_key(request)
+    job, coalesced = await run_in_db_executor(
+        find_or_create_job,
+        client_key.client,
+        request.file_path,
+        request.mapping_name,
+        request.ingest_types,
+        dedup_key,
+        request.priority,
+    )
+    message = "coalesced onto existing job" if coalesced else "success"
+    return CreateJobResponse(message=message, job_id=job.id, coalesced=coalesced)
+
+
+MAX_BATCH_JOBS = 5000
+
+
+class CreateJobsRequest(BaseModel):
+    jobs: List[CreateJobRequest] = Field(
+        description=f"Jobs to create, at most {MAX_BATCH_JOBS}"
+    )
+
+
+class CreateJobResult(BaseModel):
+    job_id: Optional[str] = Field(description="uid of newly created job, if created")
+    error: Optional[str] = Field(description="why the job was not created, if not")
+    coalesced: bool = Field(
+        False, description="true if job_id is an existing job for the same file"
+    )
+
+
+class CreateJobsResponse(BaseModel):
+    message: str = Field(description="return message")
+    results: List[CreateJobResult] = Field(
+        description="one result per requested job, in request order"
+    )
+
 
-    job = create_job(
-        client_key.client, request.file_path, request.mapping_name, request.ingest_types
+@app.post(
+    "/api/ingest/jobs/batch",
+    tags=["ingest_jobs"],
+    response_model=CreateJobsResponse,
+    response_description="Returns the result of creating each Job",
+)
+async def submit_jobs(
+    request: CreateJobsRequest, api_key: APIKey = Depends(get_api_key_from_request)
+) -> CreateJobsResponse:
+    client_key = await verify_client(api_key)
+    if len(request.jobs) > MAX_BATCH_JOBS:
+        raise HTTPException(
+            status_code=HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"at most {MAX_BATCH_JOBS} jobs can be submitted at once",
+        )
+    # keys are computed concurrently, up to INGEST_FILE_THREADS at a time
+    dedup_keys = await asyncio.gather(*(_dedup_key(job) for job in request.jobs))
+    results = await run_in_db_executor(
+        create_jobs,
+        client_key.client,
+        [
+            (job.file_path, job.mapping_name, job.ingest_types, dedup_key, job.priority)
+            for job, dedup_key in zip(request.jobs, dedup_keys)
+        ],
     )
-    return CreateJobResponse(message="success", job_id=job.id)
+    job_results = [
+        CreateJobResult(
+            job_id=job.id if job else None, error=error, coalesced=coalesced
+        )
+        for job, coalesced, error in results
+    ]
+    failed = len([result for result in job_results if result.error])
+    message = "success" if not failed else f"{failed} job(s) not created"
+    return CreateJobsResponse(message=message, results=job_results)
+
+
+MAX_STATUS_JOB_IDS = 5000
+
+
+class JobStatusesRequest(BaseModel):
+    job_ids: List[str] = Field(description=f"at most {MAX_STATUS_JOB_IDS} job ids")
+    include_last_status: bool = Field(
+        False, description="include the most recent StatusItem of each job"
+    )
+    modified_since: Optional[datetime] = Field(
+        None,
+        description="watermark from a previous response, "
+        "answered with 304 Not Modified if no job changed since",
+    )
+
+
+class JobStatusesResponse(BaseModel):
+    jobs: List[JobStatusSummary]
+    missing: List[str] = Field(description="requested job ids that don't exist")
+    watermark: Optional[datetime] = Field(
+        description="pass as modified_since to only get a response when a job changes"
+    )
+
+
+def _job_statuses_etag(job_statuses: List[JobStatusSummary], include_last_status):
+    digest = sha256(str(include_last_status).encode("utf-8"))
+    for job_status in sorted(job_statuses, key=lambda job_status: job_status.id):
+        digest.update(
+            f"{job_status.id}|{job_status.status}|{job_status.last_updated}".encode(
+                "utf-8"
+            )
+        )
+    return f'"{digest.hexdigest()}"'
+
+
+@app.post(
+    "/api/ingest/jobs/status",
+    tags=["ingest_jobs"],
+    response_model=JobStatusesResponse,
+    response_description="Returns the current status of each requested Job",
+)
+async def get_job_statuses(
+    request: JobStatusesRequest,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    api_key: APIKey = Depends(get_api_key_from_request),
+):
+    """Looks up the status of many jobs at once
+
+    Supports two kinds of conditional request, both answered with an empty
+    304 when nothing changed: sending the previous response's watermark as
+    modified_since, which skips reading the jobs altogether, or sending the
+    previous response's ETag in If-None-Match.
+    """
+    await verify_client(api_key)
+    if len(request.job_ids) > MAX_STATUS_JOB_IDS:
+        raise HTTPException(
+            status_code=HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"at most {MAX_STATUS_JOB_IDS} job ids can be requested at once",
+        )
+    if request.modified_since and not await run_in_db_executor(
+        jobs_modified_since, request.job_ids, request.modified_since
+    ):
+        return Response(status_code=HTTP_304_NOT_MODIFIED)
+
+    job_statuses, watermark = await run_in_db_executor(
+        find_job_statuses, request.job_ids, request.include_last_status
+    )
+    etag = _job_statuses_etag(job_statuses, request.include_last_status)
+    if if_none_match == etag:
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    found = {job_status.id for job_status in job_statuses}
+    return JobStatusesResponse(
+        jobs=job_statuses,
+        missing=[job_id for job_id in request.job_ids if job_id not in found],
+        watermark=watermark,
+    )
+
+
+MAX_QUERY_LIMIT = 1000
+
+
+# registered before /api/ingest/jobs/{job_id} so "query" isn't taken as a job id
+@app.get(
+    "/api/ingest/jobs/query",
+    tags=["ingest_jobs"],
+    response_model=JobPage,
+    response_description="Returns a page of Jobs matching the filters, newest first",
+)
+async def get_jobs_query(
+    status: Optional[List[JobStatus]] = Query(None),
+    submitter: Optional[str] = None,
+    mapping_id: Optional[str] = None,
+    submitted_after: Optional[datetime] = None,
+    submitted_before: Optional[datetime] = None,
+    cursor: Optional[str] = Query(
+        None, description="next_cursor from the previous page"
+    ),
+    limit: int = Query(100, ge=1, le=MAX_QUERY_LIMIT),
+    include_history: bool = False,
+    api_key: APIKey = Depends(get_api_key_from_request),
+) -> JobPage:
+    await verify_client(api_key)
+    try:
+        return await run_in_db_executor(
+            query_jobs,
+            statuses=status,
+            submitter=submitter,
+            mapping_id=mapping_id,
+            submitted_after=submitted_after,
+            submitted_before=submitted_before,
+            cursor=cursor,
+            limit=limit,
+            include_history=include_history,
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
 
 
 @app.get(
@@ -133,11 +484,8 @@ async def get_job(
     job_id: str, api_key: APIKey = Depends(get_api_key_from_request)
 ) -> Job:
     try:
-        client_key: APIKey = verify_api_key(api_key)
-        if not client_key:
-            logger.info("forbidden  {api_key}")
-            raise HTTPException(status_code=403)
-        job = find_job(job_id)
+        await verify_client(api_key)
+        job = await run_in_db_executor(find_job, job_id)
         return job
     except JobNotFoundError:
         raise HTTPException(404)
@@ -146,6 +494,150 @@ async def get_job(
         raise e
 
 
+MAX_EVENTS_TIMEOUT = 3600
+EVENTS_KEEP_ALIVE_SECONDS = 15
+
+
+def _status_event(number: int, status_item: StatusItem) -> str:
+    return f"id: {number}\nevent: status\ndata: {status_item.json()}\n\n"
+
+
+class JobStatusWatcher:
+    """Wakes event streams when their job changes
+
+    However many streams are open, the watched jobs are checked with one
+    query per poll, and a stream only reads its job's statuses when the
+    job has changed.
+    """
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._events: Dict[str, Set[asyncio.Event]] = {}
+        self._modified_times: Dict[str, Optional[datetime]] = {}
+        self._loop = None
+        self._task = None
+
+    def watch(self, job_id: str) -> asyncio.Event:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # events and the polling task belong to the loop they were created in
+            self._events.clear()
+            self._modified_times.clear()
+            self._loop = loop
+            self._task = None
+        event = asyncio.Event()
+        self._events.setdefault(job_id, set()).add(event)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._poll())
+        return event
+
+    def unwatch(self, job_id: str, event: asyncio.Event):
+        events = self._events.get(job_id, set())
+        events.discard(event)
+        if not events:
+            self._events.pop(job_id, None)
+            self._modified_times.pop(job_id, None)
+
+    async def _poll(self):
+        while self._events:
+            await asyncio.sleep(self.poll_seconds)
+            job_ids = list(self._events)
+            try:
+                modified_times = await run_in_db_executor(find_modified_times, job_ids)
+            except Exception:
+                logger.exception("checking watched jobs failed")
+                continue
+            for job_id in job_ids:
+                modified_time = modified_times.get(job_id)
+                if (
+                    job_id in self._modified_times
+                    and self._modified_times[job_id] == modified_time
+                ):
+                    continue
+                self._modified_times[job_id] = modified_time
+                for event in self._events.get(job_id, ()):
+                    event.set()
+
+
+job_watcher = JobStatusWatcher(INGEST_EVENTS_POLL_SECONDS)
+
+
+async def _job_events(job_id: str, after: Optional[int], timeout: float):
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    changed = job_watcher.watch(job_id)
+    try:
+        while True:
+            status, first, status_items = await run_in_db_executor(
+                find_new_status_items, job_id, after
+            )
+            for number, status_item in enumerate(status_items, first):
+                yield _status_event(number, status_item)
+                after = number
+                last_sent = time.monotonic()
+            if status in FINISHED_STATUSES:
+                yield "event: end\ndata: finished\n\n"
+                return
+            while not changed.is_set():
+                now = time.monotonic()
+                if now >= deadline:
+                    yield "event: end\ndata: timeout\n\n"
+                    return
+                if now - last_sent >= EVENTS_KEEP_ALIVE_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_sent = now
+                wake_in = min(
+                    deadline - now, last_sent + EVENTS_KEEP_ALIVE_SECONDS - now
+                )
+                try:
+                    await asyncio.wait_for(changed.wait(), wake_in)
+                except asyncio.TimeoutError:
+                    pass
+            changed.clear()
+    finally:
+        job_watcher.unwatch(job_id, changed)
+
+
+@app.get(
+    "/api/ingest/jobs/{job_id}/events",
+    tags=["ingest_jobs"],
+    response_description="Server-Sent Events stream of the Job's StatusItems",
+)
+async def get_job_events(
+    job_id: str,
+    timeout: float = Query(
+        300, gt=0, le=MAX_EVENTS_TIMEOUT, description="seconds to stream for"
+    ),
+    last_event_id: Optional[str] = Header(None),
+    api_key: APIKey = Depends(get_api_key_from_request),
+):
+    """Streams each StatusItem of the job as it is recorded
+
+    Every StatusItem still in the job's history is sent first, then new ones
+    as they happen. An `end` event closes the stream once the job finishes or timeout
+    passes. Each event's id is the StatusItem's position in the order the job's
+    statuses were recorded, so reconnecting with a Last-Event-ID header resumes
+    after that event.
+    """
+    await verify_client(api_key)
+    after = None
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid Last-Event-ID")
+        if after < 0:
+            raise HTTPException(status_code=400, detail="invalid Last-Event-ID")
+    # fail with a 404 before the stream starts
+    if job_id not in await run_in_db_executor(find_modified_times, [job_id]):
+        raise HTTPException(404)
+    return StreamingResponse(
+        _job_events(job_id, after, timeout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @app.get(
     "/api/ingest/jobs",
     tags=["ingest_jobs"],
@@ -156,17 +648,27 @@ async def get_unstarted_jobs(
     api_key: APIKey = Depends(get_api_key_from_request),
 ) -> List[Job]:
     try:
-        client_key: APIKey = verify_api_key(api_key)
-        if not client_key:
-            logger.info("forbidden  {api_key}")
-            raise HTTPException(status_code=403)
-        jobs = find_unstarted_jobs()
+        await verify_client(api_key)
+        jobs = await run_in_db_executor(find_unstarted_jobs)
         return jobs
     except Exception as e:
         logger.error(e)
         raise e
 
 
+@app.get(
+    "/api/ingest/pollers",
+    tags=["ingest_jobs"],
+    response_model=List[PollerStats],
+    response_description="Returns the last reported stats of each poller",
+)
+async def get_pollers(
+    api_key: APIKey = Depends(get_api_key_from_request),
+) -> List[PollerStats]:
+    await verify_client(api_key)
+    return await run_in_db_executor(find_poller_stats)
+
+
 class CreateMappingResponse(BaseModel):
     mapping_id: str
     message: str
@@ -1,6 +1,10 @@
+from collections import OrderedDict
 from dataclasses import dataclass
+from hashlib import sha256
 import logging
-from typing import List
+import threading
+import time
+from typing import Dict, List, Optional
 from uuid import uuid4
 
 
@@ -12,47 +16,198 @@ from passlib.hash import pbkdf2_sha256
 logger = logging.getLogger("splash_ingest.api")
 
 
+class VerifiedKeyCache:
+    """Bounded, expiring cache of keys that have already been verified
+
+    Entries are keyed by a sha256 digest of the full key, so plain keys
+    are never held in memory, and the least recently used entry is dropped
+    when the cache is full. Only successful verifications are cached.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional["APIClient"]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, digest: str, api_client: "APIClient"):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.ttl_seconds, api_client)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key_id: str):
+        with self._lock:
+            for digest in [
+                digest
+                for digest, (_, api_client) in self._entries.items()
+                if api_client.key_id == key_id
+            ]:
+                del self._entries[digest]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 @dataclass
 class ServiceContext:
     db: MongoClient = None
     api_client_collection: Collection = None
+    verified_keys: VerifiedKeyCache = None
 
 
 context = ServiceContext()
 
 
-def init_api_service(db: MongoClient):
+def init_api_service(
+    db: MongoClient, key_cache_size: int = 1024, key_cache_seconds: float = 300
+):
+    """Sets up the api client collection and the cache of verified keys
+
+    The cache spares requests the key hashing, but each request still checks
+    that its client hasn't been revoked, so a key revoked from any process is
+    rejected by every api process straight away.
+    """
     context.db = db
     context.api_client_collection = db["api_clients"]
+    context.verified_keys = VerifiedKeyCache(key_cache_size, key_cache_seconds)
+    # sparse, because clients created before key ids existed don't have one yet
+    context.api_client_collection.create_index("key_id", unique=True, sparse=True)
 
 
 class APIClient(BaseModel):
+    key_id: Optional[str] = Field(
+        description="Public identifier of the key, used to look it up"
+    )
     hashed_key: str = Field(description="API key that can be given to a client")
     client: str = Field(description="Name of client who key is given to")
     api: str = Field(description="Name of API that key gives access to")
 
 
+KEY_ID_SEPARATOR = "."
+
+
 def create_api_client(submitter: str, client: str, api: str) -> str:
+    """Creates a new API client, returning the key to give to the client
+
+    The key has the form key_id.secret. Only a hash of the secret is stored,
+    the key_id lets the key be found with one indexed lookup.
+    """
     try:
-        key = str(uuid4())
-        hashed_key = pbkdf2_sha256.hash(key)
-        client_key = APIClient(hashed_key=hashed_key, client=client, api=api)
+        key_id = uuid4().hex
+        secret = str(uuid4())
+        hashed_key = pbkdf2_sha256.hash(secret)
+        client_key = APIClient(
+            key_id=key_id, hashed_key=hashed_key, client=client, api=api
+        )
         context.api_client_collection.insert_one(client_key.dict())
-        return key
+        return f"{key_id}{KEY_ID_SEPARATOR}{secret}"
     except Exception as e:
         logging.error(e)
         raise e
 
 
-def verify_api_key(key):
-    for api_client in get_api_clients(
-        "sys"
-    ):  # looping through all clients is inefficient, but list issmall
+def _key_digest(key: str) -> str:
+    return sha256(key.encode("utf-8")).hexdigest()
+
+
+def verify_api_key(key) -> Optional[APIClient]:
+    digest = _key_digest(key)
+    api_client = context.verified_keys.get(digest)
+    if api_client:
+        if _is_revoked(api_client.key_id):
+            context.verified_keys.invalidate(api_client.key_id)
+            return None
+        return api_client
+
+    key_id, separator, secret = key.partition(KEY_ID_SEPARATOR)
+    if not separator:
+        api_client = _verify_legacy_api_key(key)
+    else:
+        api_client = _find_api_client(key_id)
+        if api_client and not pbkdf2_sha256.verify(secret, api_client.hashed_key):
+            api_client = None
+    if api_client:
+        context.verified_keys.put(digest, api_client)
+    return api_client
+
+
+def revoke_api_client(key_id: str) -> bool:
+    """Deletes the api client with key_id so its key is no longer accepted"""
+    delete_result = context.api_client_collection.delete_one({"key_id": key_id})
+    context.verified_keys.invalidate(key_id)
+    return delete_result.deleted_count == 1
+
+
+def _is_revoked(key_id: str) -> bool:
+    # revoking deletes the client, so an indexed lookup of its key id is enough
+    return (
+        context.api_client_collection.find_one({"key_id": key_id}, {"_id": 1}) is None
+    )
+
+
+def legacy_key_id(key: str) -> str:
+    # keys issued before key ids were a bare uuid4, far too random
+    # for their digest to be reversed, so it can safely be stored
+    return "legacy-" + sha256(key.encode("utf-8")).hexdigest()
+
+
+def _verify_legacy_api_key(key: str) -> Optional[APIClient]:
+    """Verifies a key issued before key ids existed
+
+    The first time such a key verifies, its client is stamped with a key id
+    derived from the key, so later requests need only one indexed lookup.
+    """
+    key_id = legacy_key_id(key)
+    api_client = _find_api_client(key_id)
+    if api_client:
+        return api_client if pbkdf2_sha256.verify(key, api_client.hashed_key) else None
+
+    for api_client_dict in context.api_client_collection.find(
+        {"key_id": {"$exists": False}}
+    ):
+        api_client = APIClient(**api_client_dict)
         if pbkdf2_sha256.verify(key, api_client.hashed_key):
+            context.api_client_collection.update_one(
+                {"_id": api_client_dict["_id"]}, {"$set": {"key_id": key_id}}
+            )
+            logger.info(f"migrated api key for client {api_client.client}")
+            api_client.key_id = key_id
             return api_client
     return None
 
 
+def _find_api_client(key_id: str) -> Optional[APIClient]:
+    api_client_dict = context.api_client_collection.find_one({"key_id": key_id})
+    if not api_client_dict:
+        return None
+    return APIClient(**api_client_dict)
+
+
 def get_api_clients(submitter: str) -> List[APIClient]:
     try:
         keys = list(context.api_client_collection.find())
@@ -1,39 +1,114 @@
-from dataclasses import dataclass
-from datetime import datetime
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from enum import Enum
 from importlib.util import spec_from_file_location, module_from_spec
+import base64
+import hashlib
 import json
 import logging
+import multiprocessing
+import os
 from pathlib import Path
+import signal
+import socket
 import sys
+import threading
 import time
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import traceback
 from uuid import uuid4
 
 import pandas as pd
 from pydantic import parse_obj_as
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from .model import IngestType, Job, JobStatus, StatusItem
+from .job_notifications import JobListener, JobNotifier
+from .model import (
+    DedupMode,
+    IngestType,
+    Job,
+    JobPage,
+    JobStatus,
+    JobStatusSummary,
+    JobSummary,
+    PollerStats,
+    StatusItem,
+)
+from .retry_policy import DEFAULT_MAX_ATTEMPTS, RetryPolicy
+from .scicat_clients import get_scicat_client
 
-from splash_ingest.ingestors.utils import Issue, Severity
-
-from pyscicat.client import from_credentials
+from splash_ingest.ingestors.mapping_ingestor import MappingIngestor
+from splash_ingest.ingestors.utils import Issue, Severity, StageTimer, StageTiming
 
 logger = logging.getLogger("splash_ingest.ingest_service")
 
+# fields left out of queries that only need to schedule a job
+SCHEDULING_PROJECTION = {"status_history": False}
+
+# statuses a job doesn't leave once it reaches them
+FINISHED_STATUSES = [
+    JobStatus.complete_with_issues,
+    JobStatus.successful,
+    JobStatus.error,
+    JobStatus.dead_letter,
+]
+
+# jobs that failed give up their dedup key, so the file can be submitted again
+RELEASE_DEDUP_STATUSES = [JobStatus.error, JobStatus.dead_letter]
+
+DUPLICATE_KEY_ERROR = 11000
+
+# order jobs are claimed in: priority first, then fair share, then FIFO
+CLAIM_SORT = [("priority", -1), ("fair_share_tag", 1), ("submit_time", 1)]
+
+# the fair share clock, stored alongside the flows in ingest_fair_share
+VIRTUAL_TIME_ID = "virtual_time"
+
+SUMMARY_FIELDS = [field for field in JobSummary.__fields__ if field != "status_history"]
+
+DEFAULT_LEASE_SECONDS = 60
+# allowance for job writes that land after a watermark later than their stamp was read
+WATERMARK_MARGIN = timedelta(seconds=1)
+DEFAULT_MAX_SLEEP_SECONDS = 60
+# stats of a poller that stopped reporting are removed after this long
+POLLER_STATS_TTL_SECONDS = 24 * 60 * 60
+
 
 class JobNotFoundError(Exception):
     pass
 
 
+class InvalidCursorError(ValueError):
+    pass
+
+
+class WorkerMode(str, Enum):
+    thread = "thread"
+    process = "process"
+
+
 # these context objects help us inject dependencies, useful
 # in unit testing
 @dataclass
 class ServiceMongoCollectionsContext:
     db: MongoClient = None
     ingest_jobs: Collection = None
+    ingest_pollers: Collection = None
+    ingest_fair_share: Collection = None
+    # relative share of ingest capacity per mapping_id, 1.0 when not listed
+    mapping_weights: Dict[str, float] = None
+    job_notifier: JobNotifier = None
+    # keep only the most recent statuses of each job, None keeps them all
+    status_history_limit: int = None
 
 
 service_context = ServiceMongoCollectionsContext()
@@ -42,12 +117,66 @@ service_context = ServiceMongoCollectionsContext()
 ingestor_modules = {}
 
 
-def init_ingest_service(ingest_db: MongoClient, ingestors_dir: Path = None):
+def init_ingest_service(
+    ingest_db: MongoClient,
+    ingestors_dir: Path = None,
+    job_notifier: JobNotifier = None,
+    status_history_limit: int = None,
+    mapping_weights: Dict[str, float] = None,
+    mappings_dir: Path = None,
+):
     service_context.db = ingest_db
+    for mapping_id, weight in (mapping_weights or {}).items():
+        if not weight > 0:
+            raise ValueError(
+                f"weight of mapping {mapping_id} must be positive: {weight}"
+            )
+    service_context.mapping_weights = mapping_weights or {}
+    service_context.job_notifier = job_notifier
+    service_context.status_history_limit = status_history_limit
     service_context.ingest_jobs = ingest_db["ingest_jobs"]
-    service_context.ingest_jobs.create_index([("submit_time", -1)])
+    # (submit_time, id) is the keyset that job queries page on
+    service_context.ingest_jobs.create_index([("submit_time", -1), ("id", -1)])
 
-    service_context.ingest_jobs.create_index([("status", -1)])
+    # serves the FIFO claim and next-job queries without scanning the backlog,
+    # and job queries filtered by status
+    service_context.ingest_jobs.create_index(
+        [("status", 1), ("submit_time", 1), ("id", 1)]
+    )
+
+    service_context.ingest_jobs.create_index(
+        [("submitter", 1), ("submit_time", -1), ("id", -1)]
+    )
+
+    service_context.ingest_jobs.create_index(
+        [("mapping_id", 1), ("submit_time", -1), ("id", -1)]
+    )
+
+    service_context.ingest_jobs.create_index([("status", 1), ("lease_expires", 1)])
+
+    # serves claim_job's priority and fair share ordering
+    service_context.ingest_jobs.create_index(
+        [("status", 1), *CLAIM_SORT, ("id", 1)], name="claim_order"
+    )
+    # finds the lowest waiting tag when advancing the fair share virtual time
+    service_context.ingest_jobs.create_index([("status", 1), ("fair_share_tag", 1)])
+    # jobs queued before priorities existed would otherwise sort after priority 0
+    service_context.ingest_jobs.update_many(
+        {"status": JobStatus.submitted, "priority": {"$exists": False}},
+        {"$set": {"priority": 0}},
+    )
+    # jobs created before statuses were counted start counting from their history
+    service_context.ingest_jobs.update_many(
+        {"status_count": {"$exists": False}},
+        [{"$set": {"status_count": {"$size": "$status_history"}}}],
+    )
+
+    # jobs submitted with a dedup key collapse onto the job already holding it
+    service_context.ingest_jobs.create_index(
+        [("dedup_key", 1)],
+        unique=True,
+        partialFilterExpression={"dedup_key": {"$type": "string"}},
+    )
 
     service_context.ingest_jobs.create_index(
         [
@@ -56,6 +185,18 @@ def init_ingest_service(ingest_db: MongoClient, ingestors_dir: Path = None):
         unique=True,
     )
 
+    service_context.ingest_pollers = ingest_db["ingest_pollers"]
+    service_context.ingest_pollers.create_index([("worker_id", 1)], unique=True)
+    # pollers remove their stats when they stop, these are from pollers that were killed
+    service_context.ingest_pollers.create_index(
+        [("last_updated", 1)], expireAfterSeconds=POLLER_STATS_TTL_SECONDS
+    )
+
+    service_context.ingest_fair_share = ingest_db["ingest_fair_share"]
+    service_context.ingest_fair_share.create_index(
+        [("submitter", 1), ("mapping_id", 1)], unique=True, sparse=True
+    )
+
     # Load all reader modules from the reader directory
     if not ingestors_dir:
         ingestors_dir = Path(Path().absolute(), "splash_ingest", "ingestors")
@@ -66,7 +207,7 @@ def init_ingest_service(ingest_db: MongoClient, ingestors_dir: Path = None):
             spec.loader.exec_module(ingestor_module)
             if ingestor_module.ingest_spec in ingestor_modules.keys():
                 logger.warning(
-                    f"Reader module {file} contains a duplicate spec: {ingestor_module.spec}. Ignoring."
+                    f"Reader module {file} contains a duplicate spec: {ingestor_module.ingest_spec}. Ignoring."
                 )
                 continue
             ingestor_modules[ingestor_module.ingest_spec] = ingestor_module
@@ -76,25 +217,324 @@ def init_ingest_service(ingest_db: MongoClient, ingestors_dir: Path = None):
         except Exception:
             logger.exception(f" Error loading {file}")
 
+    # mappings without an ingestor of their own use the generic mapping ingestor
+    if not mappings_dir:
+        mappings_dir = Path(Path().absolute(), "mappings")
+    for file in mappings_dir.glob("*.json"):
+        try:
+            mapping_ingestor = MappingIngestor(file)
+            if mapping_ingestor.ingest_spec in ingestor_modules.keys():
+                logger.info(
+                    f"Mapping {file} not loaded, {mapping_ingestor.ingest_spec} already has an ingestor"
+                )
+                continue
+            ingestor_modules[mapping_ingestor.ingest_spec] = mapping_ingestor
+            logger.info(
+                f"loaded mapping ingestor with spec {mapping_ingestor.ingest_spec} from {file}"
+            )
+        except Exception:
+            logger.exception(f" Error loading {file}")
+
 
-def create_job(
-    submitter, document_path: str, mapping_id: str, ingest_types: List[IngestType]
-):
+def file_dedup_key(
+    mapping_id: str, document_path: str, dedup_mode: DedupMode = DedupMode.file
+) -> Optional[str]:
+    """Returns a key identifying this version of a file, for submission with a job
 
+    DedupMode.file keys on the path, size and modification time, which
+    only needs a stat. DedupMode.content hashes the whole file, so copies of
+    a file at other paths, or rewrites with identical bytes, share a key.
+    Returns None if the mode is DedupMode.none or the file can't be read,
+    in which case the job is created without deduplication.
+    """
+    if dedup_mode == DedupMode.none:
+        return None
+    digest = hashlib.sha256(f"{mapping_id}\0".encode("utf-8"))
+    try:
+        if dedup_mode == DedupMode.content:
+            with open(document_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        else:
+            stat = os.stat(document_path)
+            digest.update(
+                f"{document_path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")
+            )
+    except OSError as e:
+        logger.info(f"not deduplicating {document_path}: {e}")
+        return None
+    return f"{dedup_mode.value}:{digest.hexdigest()}"
+
+
+def find_job_by_dedup_key(dedup_key: str) -> Optional[Job]:
+    job_dict = service_context.ingest_jobs.find_one({"dedup_key": dedup_key})
+    return Job(**job_dict) if job_dict else None
+
+
+def _mapping_weight(mapping_id: str) -> float:
+    return service_context.mapping_weights.get(mapping_id, 1.0)
+
+
+def _assign_fair_share_tags(submitter, jobs: List[Job]):
+    """Gives each job its start tag for start-time fair queuing
+
+    Each (submitter, mapping_id) is a flow whose finish tag advances by 1 / weight
+    per job. A job's tag is the later of its flow's finish tag and the virtual time,
+    the tag of the last claimed job or, if lower, of the next job waiting, so a
+    flow that was idle doesn't bank credit, and a flow with a large backlog is
+    pushed far into the future while new flows start at the head of the queue. Tags of jobs that end up not
+    being inserted are given back with `_release_fair_share_tags`.
+    """
+    clock = service_context.ingest_fair_share.find_one({"_id": VIRTUAL_TIME_ID})
+    virtual_time = clock["tag"] if clock else 0.0
+    flows = {}
+    for job in jobs:
+        flows.setdefault(job.mapping_id, []).append(job)
+    for mapping_id, flow_jobs in flows.items():
+        flow = {"submitter": submitter, "mapping_id": mapping_id}
+        cost = 1.0 / _mapping_weight(mapping_id)
+        service_context.ingest_fair_share.update_one(
+            flow, {"$max": {"finish_tag": virtual_time}}, upsert=True
+        )
+        # reserve tags for all of the flow's jobs at once, concurrent
+        # submissions to the same flow get the tags after these
+        flow = service_context.ingest_fair_share.find_one_and_update(
+            flow,
+            {"$inc": {"finish_tag": cost * len(flow_jobs)}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        for index, job in enumerate(flow_jobs):
+            job.fair_share_tag = flow["finish_tag"] + cost * index
+
+
+def _release_fair_share_tags(submitter, jobs: List[Job]):
+    """Moves flows' finish tags back by the cost of jobs that weren't inserted"""
+    counts = {}
+    for job in jobs:
+        counts[job.mapping_id] = counts.get(job.mapping_id, 0) + 1
+    for mapping_id, count in counts.items():
+        service_context.ingest_fair_share.update_one(
+            {"submitter": submitter, "mapping_id": mapping_id},
+            {"$inc": {"finish_tag": -count / _mapping_weight(mapping_id)}},
+        )
+
+
+def _advance_virtual_time(fair_share_tag: float, now: datetime):
+    """Moves the virtual time up to the tag of a claimed job
+
+    A job of higher priority can be claimed ahead of jobs with lower tags,
+    and its tag would push new flows behind all of them, so the virtual time
+    only advances as far as the lowest tag still waiting to be claimed.
+    """
+    if fair_share_tag is None:
+        return
+    next_job = service_context.ingest_jobs.find_one(
+        {**_claimable(now), "fair_share_tag": {"$lt": fair_share_tag}},
+        {"_id": False, "fair_share_tag": True},
+        sort=[("fair_share_tag", 1)],
+    )
+    if next_job:
+        fair_share_tag = next_job["fair_share_tag"]
+    service_context.ingest_fair_share.update_one(
+        {"_id": VIRTUAL_TIME_ID}, {"$max": {"tag": fair_share_tag}}, upsert=True
+    )
+
+
+def _new_job(
+    submitter,
+    document_path: str,
+    mapping_id: str,
+    ingest_types: List[IngestType],
+    dedup_key: str = None,
+    priority: int = 0,
+) -> Job:
     job = Job(document_path=document_path, ingest_types=ingest_types)
     job.id = str(uuid4())
+    job.dedup_key = dedup_key
+    job.priority = priority
     job.mapping_id = mapping_id
     job.submit_time = datetime.utcnow()
     job.submitter = submitter
     job.status = JobStatus.submitted
+    job.last_updated = job.submit_time
     job.status_history.append(
         StatusItem(time=job.submit_time, status=job.status, submitter=submitter)
     )
-    service_context.ingest_jobs.insert_one(job.dict())
+    job.status_count = len(job.status_history)
+    return job
+
+
+def _stamp_inserted(job_ids: List[str]):
+    """Sets the modified_time of newly inserted jobs from the database server's clock
+
+    Until it is set, watermarks count the jobs as changed.
+    """
+    service_context.ingest_jobs.update_many(
+        {"id": {"$in": job_ids}}, {"$currentDate": {"modified_time": True}}
+    )
+
+
+def _stamped(job_update: dict) -> dict:
+    """Adds setting modified_time from the database server's clock to a job update
+
+    Writers stamp last_updated from their own clocks, which can disagree
+    between hosts, so modified_time is what watermarks compare against.
+    """
+    return {**job_update, "$currentDate": {"modified_time": True}}
+
+
+def create_job(
+    submitter,
+    document_path: str,
+    mapping_id: str,
+    ingest_types: List[IngestType],
+    priority: int = 0,
+):
+
+    job = _new_job(
+        submitter, document_path, mapping_id, ingest_types, priority=priority
+    )
+    _assign_fair_share_tags(submitter, [job])
+    try:
+        service_context.ingest_jobs.insert_one(job.dict())
+    except Exception:
+        _release_fair_share_tags(submitter, [job])
+        raise
+    _stamp_inserted([job.id])
+    if service_context.job_notifier:
+        service_context.job_notifier.notify(job.id)
     # TODO check that file exists and throw error
     return job
 
 
+def find_or_create_job(
+    submitter,
+    document_path: str,
+    mapping_id: str,
+    ingest_types: List[IngestType],
+    dedup_key: str,
+    priority: int = 0,
+) -> Tuple[Job, bool]:
+    """Creates a job unless one holding dedup_key already exists
+
+    Returns
+    -------
+    Tuple[Job, bool]
+        the new or existing job, and whether the submission was coalesced
+        onto an existing job
+    """
+    if not dedup_key:
+        job = create_job(submitter, document_path, mapping_id, ingest_types, priority)
+        return job, False
+    # the existing job may fail and release the key between the insert and the find
+    for _ in range(2):
+        # coalescing is the common case, and takes no fair share tag
+        existing_job = find_job_by_dedup_key(dedup_key)
+        if existing_job:
+            logger.info(f"coalesced {document_path} onto job {existing_job.id}")
+            return existing_job, True
+        job = _new_job(
+            submitter, document_path, mapping_id, ingest_types, dedup_key, priority
+        )
+        _assign_fair_share_tags(submitter, [job])
+        try:
+            service_context.ingest_jobs.insert_one(job.dict())
+        except DuplicateKeyError:
+            _release_fair_share_tags(submitter, [job])
+            existing_job = find_job_by_dedup_key(dedup_key)
+            if existing_job:
+                logger.info(f"coalesced {document_path} onto job {existing_job.id}")
+                return existing_job, True
+            continue
+        except Exception:
+            _release_fair_share_tags(submitter, [job])
+            raise
+        _stamp_inserted([job.id])
+        if service_context.job_notifier:
+            service_context.job_notifier.notify(job.id)
+        return job, False
+    raise DuplicateKeyError(f"could not create job with dedup key {dedup_key}")
+
+
+def create_jobs(
+    submitter, job_requests: List[Tuple]
+) -> List[Tuple[Optional[Job], bool, Optional[str]]]:
+    """Creates many jobs with a single bulk insert
+
+    Parameters
+    ----------
+    submitter : str
+        user identification of submitter
+    job_requests : List[Tuple]
+        document_path, mapping_id and ingest_types of each job to create,
+        optionally followed by a dedup_key and a priority
+
+    Returns
+    -------
+    List[Tuple[Optional[Job], bool, Optional[str]]]
+        for each request in order, the created job, or the existing job
+        the request was coalesced onto, whether it was coalesced, and an error
+        message if no job was found or created. One job failing doesn't
+        prevent the others from being created.
+    """
+    results = []
+    jobs = []
+    for job_request in job_requests:
+        try:
+            job = _new_job(submitter, *job_request)
+            results.append((job, False, None))
+            jobs.append((len(results) - 1, job))
+        except Exception as e:
+            results.append((None, False, str(e)))
+
+    # coalesce onto existing jobs before reserving fair share tags
+    dedup_keys = [job.dedup_key for _, job in jobs if job.dedup_key]
+    if dedup_keys:
+        existing_jobs = {
+            job_dict["dedup_key"]: Job(**job_dict)
+            for job_dict in service_context.ingest_jobs.find(
+                {"dedup_key": {"$in": dedup_keys}}
+            )
+        }
+        for result_index, job in jobs:
+            if job.dedup_key in existing_jobs:
+                results[result_index] = (existing_jobs[job.dedup_key], True, None)
+        jobs = [
+            (index, job) for index, job in jobs if job.dedup_key not in existing_jobs
+        ]
+    if not jobs:
+        return results
+
+    _assign_fair_share_tags(submitter, [job for _, job in jobs])
+    # until the insert says otherwise, no job was inserted and all tags are given back
+    failed_jobs = [job for _, job in jobs]
+    try:
+        service_context.ingest_jobs.insert_many(
+            [job.dict() for _, job in jobs], ordered=False
+        )
+        failed_jobs = []
+    except BulkWriteError as e:
+        failed_jobs = []
+        for write_error in e.details.get("writeErrors", []):
+            result_index, job = jobs[write_error["index"]]
+            failed_jobs.append(job)
+            existing_job = None
+            if job.dedup_key and write_error.get("code") == DUPLICATE_KEY_ERROR:
+                existing_job = find_job_by_dedup_key(job.dedup_key)
+            if existing_job:
+                results[result_index] = (existing_job, True, None)
+            else:
+                results[result_index] = (None, False, write_error.get("errmsg"))
+    finally:
+        _release_fair_share_tags(submitter, failed_jobs)
+    created = len(jobs) - len(failed_jobs)
+    if created:
+        _stamp_inserted([job.id for _, job in jobs])
+        if service_context.job_notifier:
+            service_context.job_notifier.notify(jobs[0][1].id)
+    return results
+
+
 def find_job(job_id: str) -> Job:
     job_dict = service_context.ingest_jobs.find_one({"id": job_id})
     if not job_dict:
@@ -103,25 +543,763 @@ def find_job(job_id: str) -> Job:
 
 
 def find_unstarted_jobs() -> List[Job]:
-    jobs = list(service_context.ingest_jobs.find({"status": JobStatus.submitted}))
+    jobs = list(
+        service_context.ingest_jobs.find({"status": JobStatus.submitted}).sort(
+            "submit_time", 1
+        )
+    )
+    return parse_obj_as(List[Job], jobs)
+
+
+def _claimable(now: datetime) -> dict:
+    # submitted jobs that aren't waiting out a retry backoff
+    return {
+        "status": JobStatus.submitted,
+        "$or": [{"not_before": None}, {"not_before": {"$lte": now}}],
+    }
+
+
+def find_next_jobs(limit: int = 1) -> List[Job]:
+    """Returns claimable jobs in the order they will be claimed
+
+    Jobs are returned without their status_history, and at most limit
+    are read, so the cost doesn't depend on the size of the backlog.
+    """
+    jobs = list(
+        service_context.ingest_jobs.find(
+            _claimable(datetime.utcnow()), SCHEDULING_PROJECTION
+        )
+        .sort(CLAIM_SORT)
+        .limit(limit)
+    )
     return parse_obj_as(List[Job], jobs)
 
 
-def set_job_status(job_id, status_item: StatusItem):
+def find_new_status_items(
+    job_id: str, after: int = None, max_items: int = 20
+) -> Tuple[JobStatus, int, List[StatusItem]]:
+    """Returns a job's current status and the status items recorded after an item
+
+    Status items are numbered from 0 in the order they are recorded, by
+    the database rather than by the clocks of the hosts writing them, and
+    keep their number when older items are trimmed from the history.
+    Only the last max_items of the history are read when they reach back to
+    after, so repeatedly checking a job with a long history stays cheap.
+    Otherwise, as when after is None, the whole history is read.
+
+    Returns
+    -------
+    Tuple[JobStatus, int, List[StatusItem]]
+        the job's status, the number of the first item returned, and the items
+
+    Raises
+    ------
+    JobNotFoundError
+        if there is no job with job_id
+    """
+    status, status_count, status_items = _find_status_history(
+        job_id, None if after is None else max_items
+    )
+    first = status_count - len(status_items)
+    if after is not None and len(status_items) >= max_items and first > after + 1:
+        # items between after and the window would be missed
+        status, status_count, status_items = _find_status_history(job_id)
+        first = status_count - len(status_items)
+    if after is not None:
+        skipped = min(max(after + 1 - first, 0), len(status_items))
+        status_items = status_items[skipped:]
+        first += skipped
+    return status, first, status_items
+
+
+def _find_status_history(
+    job_id: str, max_items: int = None
+) -> Tuple[JobStatus, int, List[StatusItem]]:
+    projection = {
+        "_id": False,
+        "status": True,
+        "status_count": True,
+        "status_history": True,
+    }
+    if max_items:
+        projection["status_history"] = {"$slice": -max_items}
+    job_dict = service_context.ingest_jobs.find_one({"id": job_id}, projection)
+    if not job_dict:
+        raise JobNotFoundError(f"Job not found {job_id}")
+    status_items = parse_obj_as(List[StatusItem], job_dict.get("status_history", []))
+    status_count = job_dict.get("status_count", len(status_items))
+    return job_dict["status"], status_count, status_items
+
+
+def find_modified_times(job_ids: List[str]) -> Dict[str, Optional[datetime]]:
+    """Returns the modified_time of each job that exists, with a single query"""
+    return {
+        job_dict["id"]: job_dict.get("modified_time")
+        for job_dict in service_context.ingest_jobs.find(
+            {"id": {"$in": job_ids}}, {"_id": False, "id": True, "modified_time": True}
+        )
+    }
+
+
+def find_job_statuses(
+    job_ids: List[str], include_last_status: bool = False
+) -> Tuple[List[JobStatusSummary], Optional[datetime]]:
+    """Returns the current status of many jobs with a single query, and their watermark
+
+    Jobs that don't exist are left out of the result. The watermark is the
+    latest modified_time of the jobs, to pass to jobs_modified_since.
+    """
+    projection = {
+        "_id": False,
+        "id": True,
+        "status": True,
+        "last_updated": True,
+        "modified_time": True,
+    }
+    if include_last_status:
+        projection["status_history"] = {"$slice": -1}
+    job_statuses = []
+    watermark = None
+    for job_dict in service_context.ingest_jobs.find(
+        {"id": {"$in": job_ids}}, projection
+    ):
+        modified_time = job_dict.pop("modified_time", None)
+        if modified_time and (watermark is None or modified_time > watermark):
+            watermark = modified_time
+        status_history = job_dict.pop("status_history", None)
+        if status_history:
+            job_dict["last_status"] = status_history[-1]
+        job_statuses.append(JobStatusSummary(**job_dict))
+    return job_statuses, watermark
+
+
+def jobs_modified_since(job_ids: List[str], since: datetime) -> bool:
+    """Checks whether any of the jobs changed after since, reading no job bodies
+
+    A write stamped just before a watermark was read can become visible just
+    after, so jobs modified within WATERMARK_MARGIN before since count as
+    changed too. Jobs written before modified_time existed always do.
+    """
+    return (
+        service_context.ingest_jobs.find_one(
+            {
+                "id": {"$in": job_ids},
+                "$or": [
+                    {"modified_time": {"$gt": since - WATERMARK_MARGIN}},
+                    {"modified_time": {"$exists": False}},
+                ],
+            },
+            {"_id": True},
+        )
+        is not None
+    )
+
+
+def _encode_cursor(job: JobSummary) -> str:
+    cursor = json.dumps({"submit_time": job.submit_time.isoformat(), "id": job.id})
+    return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("utf-8")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        return datetime.fromisoformat(cursor["submit_time"]), cursor["id"]
+    except Exception as e:
+        raise InvalidCursorError(f"invalid cursor {cursor}") from e
+
+
+def query_jobs(
+    statuses: List[JobStatus] = None,
+    submitter: str = None,
+    mapping_id: str = None,
+    submitted_after: datetime = None,
+    submitted_before: datetime = None,
+    cursor: str = None,
+    limit: int = 100,
+    include_history: bool = False,
+) -> JobPage:
+    """Returns a page of jobs, newest first
+
+    Pages are found by keyset on (submit_time, id) rather than by skipping,
+    so every page costs the same however deep into the results it is.
+
+    Parameters
+    ----------
+    statuses : List[JobStatus], optional
+        only return jobs in one of these statuses
+    submitter : str, optional
+        only return jobs from this submitter
+    mapping_id : str, optional
+        only return jobs for this mapping
+    submitted_after : datetime, optional
+        only return jobs submitted at or after this time
+    submitted_before : datetime, optional
+        only return jobs submitted before this time
+    cursor : str, optional
+        next_cursor of the previous page
+    limit : int, optional
+        maximum number of jobs in the page, by default 100
+    include_history : bool, optional
+        include each job's status_history, by default False
+
+    Returns
+    -------
+    JobPage
+        jobs in the page and the cursor for the next one
+
+    Raises
+    ------
+    InvalidCursorError
+        if cursor wasn't returned by query_jobs
+    """
+    query = {}
+    if statuses:
+        query["status"] = {"$in": statuses}
+    if submitter:
+        query["submitter"] = submitter
+    if mapping_id:
+        query["mapping_id"] = mapping_id
+    submit_time = {}
+    if submitted_after:
+        submit_time["$gte"] = submitted_after
+    if submitted_before:
+        submit_time["$lt"] = submitted_before
+    if submit_time:
+        query["submit_time"] = submit_time
+    if cursor:
+        cursor_time, cursor_id = _decode_cursor(cursor)
+        query = {
+            "$and": [
+                query,
+                {
+                    "$or": [
+                        {"submit_time": {"$lt": cursor_time}},
+                        {"submit_time": cursor_time, "id": {"$lt": cursor_id}},
+                    ]
+                },
+            ]
+        }
+
+    fields = SUMMARY_FIELDS + ["status_history"] if include_history else SUMMARY_FIELDS
+    job_dicts = (
+        service_context.ingest_jobs.find(query, {field: True for field in fields})
+        .sort([("submit_time", -1), ("id", -1)])
+        .limit(limit + 1)
+    )
+    jobs = parse_obj_as(List[JobSummary], list(job_dicts))
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = _encode_cursor(jobs[-1])
+    return JobPage(jobs=jobs, next_cursor=next_cursor)
+
+
+def _push_status(status_item: StatusItem) -> dict:
+    if not service_context.status_history_limit:
+        return {"status_history": status_item.dict()}
+    return {
+        "status_history": {
+            "$each": [status_item.dict()],
+            "$slice": -service_context.status_history_limit,
+        }
+    }
+
+
+def set_job_status(
+    job_id,
+    status_item: StatusItem,
+    worker_id: str = None,
+    stage_timings: List[StageTiming] = None,
+):
+    """Records a new status for a job in a single atomic update
+
+    Moving to running sets start_time and moving to a finished status
+    sets end_time. If worker_id is given, the job is only updated while that worker
+    still holds it, so a worker whose lease was reclaimed can't
+    overwrite the status of a job that was handed to someone else.
+    stage_timings, if given, replace those of the job's previous attempt.
+    """
+    job_filter = {"id": job_id}
+    if worker_id:
+        job_filter["worker_id"] = worker_id
+    job_fields = {"status": status_item.status, "last_updated": status_item.time}
+    if status_item.status == JobStatus.running:
+        job_fields["start_time"] = status_item.time
+    elif status_item.status in FINISHED_STATUSES:
+        job_fields["end_time"] = status_item.time
+    if stage_timings is not None:
+        job_fields["stage_timings"] = [asdict(timing) for timing in stage_timings]
+    job_update = {
+        "$set": job_fields,
+        "$inc": {"status_count": 1},
+        "$push": _push_status(status_item),
+    }
+    if status_item.status in RELEASE_DEDUP_STATUSES:
+        job_update["$unset"] = {"dedup_key": ""}
     update_result = service_context.ingest_jobs.update_one(
-        {"id": job_id},
+        job_filter, _stamped(job_update)
+    )
+    return update_result.modified_count == 1
+
+
+def retry_job(
+    job_id,
+    status_item: StatusItem,
+    not_before: datetime,
+    worker_id: str = None,
+    stage_timings: List[StageTiming] = None,
+):
+    """Returns a failed job to the queue, to be claimed again after not_before
+
+    Like set_job_status, a given worker_id must still hold the job.
+    """
+    job_filter = {"id": job_id}
+    if worker_id:
+        job_filter["worker_id"] = worker_id
+    job_fields = {
+        "status": JobStatus.submitted,
+        "last_updated": status_item.time,
+        "not_before": not_before,
+        "worker_id": None,
+        "lease_expires": None,
+    }
+    if stage_timings is not None:
+        job_fields["stage_timings"] = [asdict(timing) for timing in stage_timings]
+    update_result = service_context.ingest_jobs.update_one(
+        job_filter,
+        _stamped(
+            {
+                "$set": job_fields,
+                "$inc": {"status_count": 1},
+                "$push": _push_status(status_item),
+            }
+        ),
+    )
+    return update_result.modified_count == 1
+
+
+def claim_job(
+    submitter: str,
+    worker_id: str = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+) -> Optional[Job]:
+    """Atomically moves the next claimable job to running and returns it.
+
+    Jobs are claimed highest priority first. Within a priority, jobs are
+    ordered by their fair share tag, so a submitter's large backfill is interleaved
+    with other submitters' and mappings' jobs instead of delaying them, and
+    by submit time after that.
+
+    Uses a single find-and-modify, so any number of pollers can claim from the
+    same collection without two of them receiving the same job. The returned
+    job does not include its status_history.
+
+    Parameters
+    ----------
+    submitter : str
+        user identification of the process claiming the job
+    worker_id : str, optional
+        identifies the worker that holds the job's lease
+    lease_seconds : float, optional
+        how long the job is held without a heartbeat before it can be
+        reclaimed, by default DEFAULT_LEASE_SECONDS
+
+    Returns
+    -------
+    Optional[Job]
+        the claimed job, or None if no job was waiting
+    """
+    now = datetime.utcnow()
+    status_item = StatusItem(
+        time=now,
+        submitter=submitter,
+        status=JobStatus.running,
+        log=f"Starting job on worker {worker_id}",
+    )
+    job_dict = service_context.ingest_jobs.find_one_and_update(
+        _claimable(now),
+        _stamped(
+            {
+                "$set": {
+                    "start_time": status_item.time,
+                    "status": status_item.status,
+                    "last_updated": now,
+                    "worker_id": worker_id,
+                    "lease_expires": now + timedelta(seconds=lease_seconds),
+                    "heartbeat_time": now,
+                },
+                "$inc": {"attempts": 1, "status_count": 1},
+                "$push": _push_status(status_item),
+            }
+        ),
+        projection=SCHEDULING_PROJECTION,
+        sort=CLAIM_SORT,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not job_dict:
+        return None
+    job = Job(**job_dict)
+    _advance_virtual_time(job.fair_share_tag, now)
+    return job
+
+
+def renew_job_leases(
+    job_ids: List[str], worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS
+) -> int:
+    """Extends the leases of running jobs held by worker_id, returns the number renewed"""
+    if not job_ids:
+        return 0
+    now = datetime.utcnow()
+    update_result = service_context.ingest_jobs.update_many(
+        {"id": {"$in": job_ids}, "worker_id": worker_id, "status": JobStatus.running},
         {
             "$set": {
-                "start_time": status_item.time,
-                "status": status_item.status,
-                "submitter": status_item.submitter,
+                "lease_expires": now + timedelta(seconds=lease_seconds),
+                "heartbeat_time": now,
             }
         },
     )
-    update_result = service_context.ingest_jobs.update_one(
-        {"id": job_id}, {"$push": {"status_history": status_item.dict()}}
+    return update_result.matched_count
+
+
+def release_jobs(job_ids: List[str], worker_id: str, log: str = None) -> int:
+    """Returns running jobs held by worker_id to the queue, for another poller to claim
+
+    Used when a poller shuts down before its ingests finish. The interrupted
+    attempt isn't counted against the job's max_attempts. Jobs are only
+    released while worker_id still holds them, and once released, a late
+    status from the interrupted ingest is ignored.
+
+    Returns
+    -------
+    int
+        number of jobs released
+    """
+    if not job_ids:
+        return 0
+    now = datetime.utcnow()
+    status_item = StatusItem(
+        time=now,
+        status=JobStatus.submitted,
+        submitter="system",
+        log=log or f"Released by worker {worker_id}, returning job to the queue",
     )
-    return update_result.modified_count == 1
+    update_result = service_context.ingest_jobs.update_many(
+        {"id": {"$in": job_ids}, "worker_id": worker_id, "status": JobStatus.running},
+        _stamped(
+            {
+                "$set": {
+                    "status": JobStatus.submitted,
+                    "last_updated": now,
+                    "worker_id": None,
+                    "lease_expires": None,
+                },
+                "$inc": {"attempts": -1, "status_count": 1},
+                "$push": _push_status(status_item),
+            }
+        ),
+    )
+    return update_result.modified_count
+
+
+def reclaim_expired_jobs(max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+    """Returns running jobs whose lease has lapsed to the queue
+
+    A job's lease lapses when the worker that claimed it stops sending
+    heartbeats, for example because its container was killed. Jobs that
+    have already been attempted max_attempts times are dead lettered instead.
+
+    Returns
+    -------
+    int
+        number of jobs returned to the queue
+    """
+    now = datetime.utcnow()
+    expired = {"status": JobStatus.running, "lease_expires": {"$lt": now}}
+    requeue_status = StatusItem(
+        time=now,
+        status=JobStatus.submitted,
+        submitter="system",
+        log="Lease expired, returning job to the queue",
+    )
+    requeued = service_context.ingest_jobs.update_many(
+        {**expired, "attempts": {"$lt": max_attempts}},
+        _stamped(
+            {
+                "$set": {
+                    "status": JobStatus.submitted,
+                    "last_updated": now,
+                    "worker_id": None,
+                    "lease_expires": None,
+                },
+                "$inc": {"status_count": 1},
+                "$push": _push_status(requeue_status),
+            }
+        ),
+    )
+    dead_status = StatusItem(
+        time=now,
+        status=JobStatus.dead_letter,
+        submitter="system",
+        log=f"Lease expired after {max_attempts} attempts, giving up",
+    )
+    dead = service_context.ingest_jobs.update_many(
+        {**expired, "attempts": {"$gte": max_attempts}},
+        _stamped(
+            {
+                "$set": {
+                    "status": JobStatus.dead_letter,
+                    "last_updated": now,
+                    "end_time": now,
+                    "worker_id": None,
+                    "lease_expires": None,
+                },
+                "$unset": {"dedup_key": ""},
+                "$inc": {"status_count": 1},
+                "$push": _push_status(dead_status),
+            }
+        ),
+    )
+    if requeued.modified_count or dead.modified_count:
+        logger.warning(
+            f"lease expired: {requeued.modified_count} job(s) requeued, "
+            f"{dead.modified_count} job(s) dead lettered"
+        )
+    return requeued.modified_count
+
+
+def report_poller_stats(stats: PollerStats):
+    stats.last_updated = datetime.utcnow()
+    service_context.ingest_pollers.replace_one(
+        {"worker_id": stats.worker_id}, stats.dict(), upsert=True
+    )
+
+
+def remove_poller_stats(worker_id: str):
+    service_context.ingest_pollers.delete_one({"worker_id": worker_id})
+
+
+def find_poller_stats() -> List[PollerStats]:
+    pollers = service_context.ingest_pollers.find({}, {"_id": False}).sort(
+        "worker_id", 1
+    )
+    return parse_obj_as(List[PollerStats], list(pollers))
+
+
+class PollBackoff:
+    """Adapts how long a poller waits between polls
+
+    The interval doubles after each poll that fails or finds no work, up
+    to max_interval, and drops back to min_interval as soon as a job is
+    claimed. That keeps an idle or disconnected poller from spinning,
+    while a busy one polls at full speed.
+    """
+
+    def __init__(
+        self, worker_id: str, min_interval: float, max_interval: float, multiplier=2.0
+    ):
+        self.worker_id = worker_id
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.multiplier = multiplier
+        self.interval = min_interval
+        self.consecutive_failures = 0
+        self.consecutive_empty_polls = 0
+        self.last_success_time = None
+        self.last_error = None
+
+    def _grow(self):
+        self.interval = min(self.interval * self.multiplier, self.max_interval)
+
+    def found_work(self):
+        self.interval = self.min_interval
+        self.consecutive_failures = 0
+        self.consecutive_empty_polls = 0
+        self.last_success_time = datetime.utcnow()
+
+    def found_nothing(self):
+        # the first empty poll after a claim waits the normal interval
+        if self.consecutive_empty_polls or self.consecutive_failures:
+            self._grow()
+        self.consecutive_failures = 0
+        self.consecutive_empty_polls += 1
+        self.last_success_time = datetime.utcnow()
+
+    def failed(self, exception: Exception):
+        self._grow()
+        self.consecutive_failures += 1
+        self.last_error = repr(exception)
+
+    def stats(self) -> PollerStats:
+        return PollerStats(
+            worker_id=self.worker_id,
+            current_interval=self.interval,
+            consecutive_failures=self.consecutive_failures,
+            consecutive_empty_polls=self.consecutive_empty_polls,
+            last_success_time=self.last_success_time,
+            last_error=self.last_error,
+        )
+
+
+class LeaseKeeper(threading.Thread):
+    """Background thread that heartbeats the jobs a poller is running
+
+    Every third of the lease it renews the leases of all jobs it tracks in one
+    update, and reclaims jobs whose workers have stopped heartbeating. With
+    a poll_backoff it also records the poller's stats in ingest_pollers.
+    """
+
+    def __init__(
+        self,
+        worker_id: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        poll_backoff: PollBackoff = None,
+    ):
+        super().__init__(name="lease_keeper", daemon=True)
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_backoff = poll_backoff
+        self._job_ids = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def add(self, job_id: str):
+        with self._lock:
+            self._job_ids.add(job_id)
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._job_ids.discard(job_id)
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                with self._lock:
+                    job_ids = list(self._job_ids)
+                renew_job_leases(job_ids, self.worker_id, self.lease_seconds)
+                reclaim_expired_jobs(self.max_attempts)
+                if self.poll_backoff:
+                    report_poller_stats(self.poll_backoff.stats())
+            except Exception:
+                logger.exception("lease keeper exception")
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
+
+
+def _init_worker_process(
+    ingest_db_uri: str, ingest_db_name: str, log_level: str, service_options: dict
+):
+    # Ctrl-C reaches every process in the foreground group, workers leave
+    # shutting down to the poller, which drains their ingests first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # pymongo clients can't be shared across processes, so each
+    # worker process opens its own connection and loads the ingestors
+    root_logger = logging.getLogger("splash_ingest")
+    root_logger.setLevel(log_level)
+    ch = logging.StreamHandler()
+    ch.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    root_logger.handlers.clear()
+    root_logger.addHandler(ch)
+    init_ingest_service(MongoClient(ingest_db_uri)[ingest_db_name], **service_options)
+
+
+def create_worker_pool(
+    max_workers: int,
+    mode: WorkerMode = WorkerMode.thread,
+    ingest_db_uri: str = None,
+    ingest_db_name: str = None,
+    log_level: str = "INFO",
+    **service_options,
+) -> Executor:
+    """Creates the executor that poll_for_new_jobs runs ingests in
+
+    Parameters
+    ----------
+    max_workers : int
+        maximum number of ingests to run at once
+    mode : WorkerMode, optional
+        thread workers suit I/O bound ingests, process workers avoid
+        serializing h5py and numpy work on the GIL, by default WorkerMode.thread
+    ingest_db_uri : str, optional
+        uri of the ingest database, required for process workers
+    ingest_db_name : str, optional
+        name of the ingest database, required for process workers
+    log_level : str, optional
+        log level for process workers, by default "INFO"
+    service_options
+        keyword arguments process workers pass to init_ingest_service
+
+    Returns
+    -------
+    Executor
+        executor to pass to poll_for_new_jobs, owned by the caller
+    """
+    if mode == WorkerMode.process:
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker_process,
+            initargs=(ingest_db_uri, ingest_db_name, log_level, service_options),
+        )
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+
+
+def _reap_finished(in_flight: dict) -> dict:
+    # in_flight maps each ingest's future to its job id
+    running = {}
+    for future, job_id in in_flight.items():
+        if not future.done():
+            running[future] = job_id
+        elif not future.cancelled() and future.exception():
+            logger.error("ingest worker exception", exc_info=future.exception())
+    return running
+
+
+def _drain(in_flight: dict, drain_seconds: float, worker_id: str) -> List[str]:
+    """Waits up to drain_seconds for in-flight ingests, then releases the rest"""
+    logger.info(
+        f"Terminate requested, waiting up to {drain_seconds}s "
+        f"on {len(in_flight)} running job(s)"
+    )
+    _, unfinished = wait(in_flight, timeout=drain_seconds)
+    _reap_finished(in_flight)
+    if not unfinished:
+        return []
+    for future in unfinished:
+        future.cancel()
+    job_ids = [in_flight[future] for future in unfinished]
+    released = release_jobs(
+        job_ids,
+        worker_id,
+        f"Worker {worker_id} shut down before the job finished, returning job to the queue",
+    )
+    logger.warning(
+        f"{len(job_ids)} job(s) still running after {drain_seconds}s, "
+        f"{released} released back to the queue"
+    )
+    return job_ids
+
+
+def _wait_for_jobs(job_listener: JobListener, timeout, terminate_requested):
+    # wait in short slices so a terminate request isn't held up by a long sleep
+    deadline = time.monotonic() + timeout
+    while not terminate_requested.state:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if job_listener is None:
+            time.sleep(min(remaining, 1.0))
+        elif job_listener.wait(min(remaining, 1.0)):
+            return
 
 
 def poll_for_new_jobs(
@@ -131,32 +1309,125 @@ def poll_for_new_jobs(
     scicat_password,
     terminate_requested,
     thumbs_root=None,
-):
+    executor: Executor = None,
+    max_workers: int = 1,
+    job_listener: JobListener = None,
+    worker_id: str = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    retry_policy: RetryPolicy = None,
+    max_sleep_interval: float = DEFAULT_MAX_SLEEP_SECONDS,
+    drain_seconds: float = None,
+) -> List[str]:
+    """Claims submitted jobs and ingests them until termination is requested
 
-    logger.info(f"Beginning polling, waiting {sleep_interval} each time")
-    while True:
-        try:
-            job_list = find_unstarted_jobs()
-            if terminate_requested.state:
-                logger.info("Terminate requested, exiting")
-                return
-            if len(job_list) == 0:
-                time.sleep(sleep_interval)
-            else:
-                job: Job = job_list[-1]
+    With no executor, jobs are ingested one at a time on the calling thread.
+    With an executor, up to max_workers jobs are in flight at once and no new
+    job is claimed until a worker is free. Once terminate_requested.state is
+    set, no new jobs are claimed and in-flight ingests are given drain_seconds
+    to finish, or as long as they need if drain_seconds is None. Jobs still
+    running after that are released back to submitted, and their ids are returned
+    so the caller can stop the abandoned workers.
+
+    With a job_listener, an idle poller wakes as soon as a job is submitted and
+    sleep_interval is only the fallback between Mongo polls.
+
+    While polling, a LeaseKeeper heartbeats the jobs this poller is running and
+    requeues jobs abandoned by other pollers, up to max_attempts per job.
+    Ingests that fail with a retryable error are rescheduled by retry_policy,
+    which defaults to a RetryPolicy with max_attempts.
+
+    The wait between polls starts at sleep_interval and backs off up to
+    max_sleep_interval while polls fail or find nothing. The poller's
+    current interval, failures and last success are saved in
+    ingest_pollers, see `find_poller_stats`, and removed when polling stops.
+    """
+    worker_id = worker_id or default_worker_id()
+    retry_policy = retry_policy or RetryPolicy(max_attempts=max_attempts)
+    logger.info(
+        f"Beginning polling as {worker_id}, waiting {sleep_interval} each time, "
+        f"{max_workers} worker(s)"
+    )
+    poll_backoff = PollBackoff(worker_id, sleep_interval, max_sleep_interval)
+    lease_keeper = LeaseKeeper(
+        worker_id, lease_seconds, retry_policy.max_attempts, poll_backoff
+    )
+    lease_keeper.start()
+    in_flight = {}
+    try:
+        while True:
+            try:
+                in_flight = _reap_finished(in_flight)
+                if terminate_requested.state:
+                    released = _drain(in_flight, drain_seconds, worker_id)
+                    logger.info("exiting")
+                    return released
+                if len(in_flight) >= max_workers:
+                    # short timeout so a terminate request is seen promptly
+                    wait(
+                        in_flight,
+                        timeout=min(sleep_interval, 1.0),
+                        return_when=FIRST_COMPLETED,
+                    )
+                    continue
+                try:
+                    job = claim_job("system", worker_id, lease_seconds)
+                except Exception as e:
+                    poll_backoff.failed(e)
+                    if poll_backoff.consecutive_failures == 1:
+                        logger.exception("polling for jobs failed")
+                    else:
+                        logger.warning(
+                            f"polling for jobs failed {poll_backoff.consecutive_failures} "
+                            f"times in a row, next poll in {poll_backoff.interval}s: {e!r}"
+                        )
+                    _wait_for_jobs(None, poll_backoff.interval, terminate_requested)
+                    continue
+                if poll_backoff.consecutive_failures:
+                    logger.info("polling for jobs recovered")
+                if job is None:
+                    poll_backoff.found_nothing()
+                    _wait_for_jobs(
+                        job_listener, poll_backoff.interval, terminate_requested
+                    )
+                    continue
+                poll_backoff.found_work()
                 logger.info(
                     f"ingesting path: {job.document_path} mapping: {job.mapping_id}"
                 )
-                ingest(
+                lease_keeper.add(job.id)
+                args = (
                     "system",
-                    job_list[-1],
+                    job,
                     thumbs_root,
                     scicat_baseurl,
                     scicat_user,
                     scicat_password,
+                    retry_policy,
                 )
-        except Exception as e:
-            logger.exception("polling thread exception", e)
+                if executor is None:
+                    try:
+                        ingest(*args)
+                    finally:
+                        lease_keeper.remove(job.id)
+                else:
+                    future = executor.submit(ingest, *args)
+                    future.add_done_callback(
+                        lambda _, job_id=job.id: lease_keeper.remove(job_id)
+                    )
+                    in_flight[future] = job.id
+            except Exception as e:
+                logger.exception("polling thread exception")
+                poll_backoff.failed(e)
+                _wait_for_jobs(None, poll_backoff.interval, terminate_requested)
+    finally:
+        lease_keeper.stop()
+        # so a last report can't land after the stats are removed
+        lease_keeper.join(timeout=5)
+        try:
+            remove_poller_stats(worker_id)
+        except Exception:
+            logger.exception("could not remove poller stats")
 
 
 def ingest(
@@ -166,8 +1437,19 @@ def ingest(
     scicat_baseurl=None,
     scicat_user=None,
     scicat_password=None,
+    retry_policy: RetryPolicy = None,
 ) -> str:
-    """Updates job status and calls ingest method specified in job
+    """Calls ingest method specified in job and records the outcome
+
+    The job must already have been claimed with `claim_job`, which
+    is what moves it from submitted to running.
+
+    If the ingest raises an error that retry_policy considers retryable, the job
+    goes back to the queue until it has been attempted max_attempts times, then
+    it is dead lettered. Other errors set the job to error straight away.
+
+    Stages the ingestor times with `splash_ingest.ingestors.utils.stage` are
+    saved in the job's stage_timings and summarized in the final status log.
 
     Parameters
     ----------
@@ -175,35 +1457,17 @@ def ingest(
         user identification of submitter
     job : Job
         job tracking this ingestion
+    retry_policy : RetryPolicy, optional
+        decides which failures are retried, by default RetryPolicy()
 
     Returns
     -------
     str
         uid of the newly created start document
     """
+    stage_timer = StageTimer()
     try:
         logger.info(f"{job.id} started job {job.id}")
-
-        # this can be run on many processes, so
-        # we can use thread locks to assure that the
-        # job hasn't already been started, so check here first. Not perfect...
-        persisted_job = find_job(job.id)
-        if persisted_job.status != JobStatus.submitted:
-            logger.info(
-                f"{job.id} on document {job.document_path} already started, exiting."
-            )
-            return
-
-        set_job_status(
-            job.id,
-            StatusItem(
-                time=datetime.utcnow(),
-                submitter=job.submitter,
-                status=JobStatus.running,
-                log="Starting job",
-            ),
-        )
-
         issues = []
         ingestor_module = ingestor_modules.get(job.mapping_id)
         if not ingestor_module:
@@ -220,13 +1484,20 @@ def ingest(
 
         if job.mapping_id in ingestor_modules:
             logger.info(f"{job.id} scicat ingestion starting")
-            scicat_client = from_credentials(
-                scicat_baseurl, scicat_user, scicat_password
-            )
-            dataset_id = ingestor_module.ingest(
-                scicat_client, scicat_user, job.document_path, Path(thumbs_root), issues
-            )
+            with stage_timer.activate():
+                with stage_timer.stage("scicat_login"):
+                    scicat_client = get_scicat_client(
+                        scicat_baseurl, scicat_user, scicat_password
+                    )
+                dataset_id = ingestor_module.ingest(
+                    scicat_client,
+                    scicat_user,
+                    job.document_path,
+                    Path(thumbs_root) if thumbs_root else None,
+                    issues,
+                )
             logger.info(f"ingested {dataset_id}")
+            logger.info(f"{job.id} stage timings\n{stage_timer.summary()}")
 
         job_log = f"ingested dataset: {job.document_path} as {dataset_id}"
         if issues and len(issues) > 0:
@@ -237,6 +1508,7 @@ def ingest(
                 job_log += f"\n :  {issue.msg}"
                 if issue.exception:
                     job_log += f"\n    Exception: {issue.exception}"
+            job_log += _stage_timings_log(stage_timer)
             status = StatusItem(
                 time=datetime.utcnow(),
                 status=status,
@@ -249,21 +1521,54 @@ def ingest(
                 time=datetime.utcnow(),
                 status=JobStatus.successful,
                 submitter=submitter,
-                log=job_log,
+                log=job_log + _stage_timings_log(stage_timer),
             )
-        set_job_status(job.id, status)
+        set_job_status(job.id, status, job.worker_id, stage_timer.timings)
         return dataset_id
 
     except Exception:
         exc_type, exc_value, exc_tb = sys.exc_info()
-        job_log = traceback.format_exception(exc_type, exc_value, exc_tb)
+        job_log = str(traceback.format_exception(exc_type, exc_value, exc_tb))
+        job_log += _stage_timings_log(stage_timer)
+        retry_policy = retry_policy or RetryPolicy()
+        now = datetime.utcnow()
+        status = JobStatus.error
+        if retry_policy.is_retryable(exc_value):
+            attempt = max(job.attempts, 1)
+            if attempt < retry_policy.max_attempts:
+                delay = retry_policy.backoff(attempt)
+                logger.warning(
+                    f"{job.id} attempt {attempt} failed, retrying in {delay:.0f}s"
+                )
+                status = StatusItem(
+                    time=now,
+                    status=JobStatus.submitted,
+                    submitter=submitter,
+                    log=f"Attempt {attempt} failed, retrying in {delay:.0f} seconds: {job_log}",
+                )
+                retry_job(
+                    job.id,
+                    status,
+                    now + timedelta(seconds=delay),
+                    job.worker_id,
+                    stage_timer.timings,
+                )
+                return
+            status = JobStatus.dead_letter
+            job_log = f"Giving up after {attempt} attempts: {job_log}"
         status = StatusItem(
-            time=datetime.utcnow(),
-            status=JobStatus.error,
+            time=now,
+            status=status,
             submitter=submitter,
-            log=str(job_log),
+            log=job_log,
         )
-        set_job_status(job.id, status)
+        set_job_status(job.id, status, job.worker_id, stage_timer.timings)
+
+
+def _stage_timings_log(stage_timer: StageTimer) -> str:
+    if not stage_timer.timings:
+        return ""
+    return f"\nstage timings:\n{stage_timer.summary()}"
 
 
 def sample_event_page(event_page, sample_size=10):
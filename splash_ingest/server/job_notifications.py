@@ -0,0 +1,77 @@
+import logging
+import threading
+from typing import Sequence
+
+import zmq
+
+logger = logging.getLogger("splash_ingest.job_notifications")
+
+JOB_SUBMITTED_TOPIC = b"job_submitted"
+
+
+class JobNotifier:
+    """Publishes a small message each time a job is submitted
+
+    The notifier connects to the address each poller listens on, so
+    any number of API workers can publish without contending for an
+    address. Publishing never blocks: if no poller is listening, or a poller
+    is not keeping up, messages are dropped. Pollers always fall back
+    to querying Mongo, so a dropped message only delays a job.
+    """
+
+    def __init__(self, connect_uris: Sequence[str], context: zmq.Context = None):
+        self._context = context or zmq.Context.instance()
+        self._socket = self._context.socket(zmq.PUB)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.setsockopt(zmq.SNDHWM, 1000)
+        try:
+            for connect_uri in connect_uris:
+                self._socket.connect(connect_uri)
+        except zmq.ZMQError:
+            self._socket.close()
+            raise
+        # zmq sockets are not thread safe
+        self._lock = threading.Lock()
+
+    def notify(self, job_id: str):
+        try:
+            with self._lock:
+                self._socket.send_multipart(
+                    [JOB_SUBMITTED_TOPIC, job_id.encode("utf-8")], flags=zmq.NOBLOCK
+                )
+        except zmq.ZMQError:
+            logger.warning(f"could not publish job notification for {job_id}")
+
+    def close(self):
+        with self._lock:
+            self._socket.close()
+
+
+class JobListener:
+    """Listens on an address for the notifications published by JobNotifiers"""
+
+    def __init__(self, bind_uri: str, context: zmq.Context = None):
+        self._context = context or zmq.Context.instance()
+        self._socket = self._context.socket(zmq.SUB)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.setsockopt(zmq.SUBSCRIBE, JOB_SUBMITTED_TOPIC)
+        try:
+            self._socket.bind(bind_uri)
+        except zmq.ZMQError:
+            self._socket.close()
+            raise
+
+    def wait(self, timeout: float) -> bool:
+        """Waits up to timeout seconds for a job to be submitted
+
+        Returns True if any notification arrived. Notifications that queued
+        up while the caller was busy are all consumed by a single call.
+        """
+        if not self._socket.poll(int(timeout * 1000)):
+            return False
+        while self._socket.poll(0):
+            self._socket.recv_multipart()
+        return True
+
+    def close(self):
+        self._socket.close()
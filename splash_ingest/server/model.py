@@ -3,9 +3,9 @@ from enum import Enum
 
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from splash_ingest.ingestors.utils import Issue
+from splash_ingest.ingestors.utils import Issue, StageTiming
 
 
 class RevisionStamp(BaseModel):
@@ -25,6 +25,13 @@ class JobStatus(str, Enum):
     complete_with_issues = "complete_with_issues"
     successful = "successful"
     error = "error"
+    dead_letter = "dead_letter"
+
+
+class DedupMode(str, Enum):
+    none = "none"
+    file = "file"  # path, size and modification time
+    content = "content"  # hash of the file's bytes
 
 
 class StatusItem(BaseModel):
@@ -45,7 +52,67 @@ class Job(BaseModel):
     mapping_id: Optional[str] = None
     submitter: Optional[str]
     status_history: Optional[List[StatusItem]] = []
+    # statuses ever recorded, including any trimmed from status_history
+    status_count: int = 0
     ingest_types: Optional[List[IngestType]]
+    worker_id: Optional[str] = None
+    lease_expires: Optional[datetime] = None
+    heartbeat_time: Optional[datetime] = None
+    attempts: int = 0
+    not_before: Optional[datetime] = None
+    last_updated: Optional[datetime] = None
+    dedup_key: Optional[str] = None
+    priority: int = 0
+    fair_share_tag: Optional[float] = None
+    stage_timings: Optional[List[StageTiming]] = None
+
+
+class JobSummary(BaseModel):
+    id: str
+    submit_time: Optional[datetime] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    document_path: str
+    status: JobStatus = None
+    mapping_id: Optional[str] = None
+    submitter: Optional[str]
+    ingest_types: Optional[List[IngestType]]
+    attempts: int = 0
+    not_before: Optional[datetime] = None
+    priority: int = 0
+    status_history: Optional[List[StatusItem]] = Field(
+        None, description="only included when requested"
+    )
+
+
+class JobPage(BaseModel):
+    jobs: List[JobSummary]
+    next_cursor: Optional[str] = Field(
+        None, description="pass as cursor to get the next page, None on the last page"
+    )
+
+
+class JobStatusSummary(BaseModel):
+    id: str
+    status: JobStatus
+    last_updated: Optional[datetime] = None
+    last_status: Optional[StatusItem] = Field(
+        None, description="most recent StatusItem, only included when requested"
+    )
+
+
+class PollerStats(BaseModel):
+    worker_id: str
+    current_interval: float = Field(
+        ..., description="seconds the poller waits before its next poll"
+    )
+    consecutive_failures: int = 0
+    consecutive_empty_polls: int = 0
+    last_success_time: Optional[datetime] = Field(
+        None, description="last time a poll reached the database"
+    )
+    last_error: Optional[str] = None
+    last_updated: Optional[datetime] = None
 
 
 class Entity(BaseModel):
@@ -1,12 +1,20 @@
 import logging
+import multiprocessing
+import os
 import signal
 
-# import threading
-
 from pymongo import MongoClient
 from starlette.config import Config
+import zmq
 
-from splash_ingest.server.ingest_service import init_ingest_service, poll_for_new_jobs
+from splash_ingest.server.ingest_service import (
+    create_worker_pool,
+    init_ingest_service,
+    poll_for_new_jobs,
+    WorkerMode,
+)
+from splash_ingest.server.job_notifications import JobListener
+from splash_ingest.server.retry_policy import RetryPolicy
 
 config = Config(".env")
 INGEST_DB_URI = config(
@@ -15,7 +23,24 @@ INGEST_DB_URI = config(
 INGEST_DB_NAME = config("INGEST_DB_NAME", cast=str, default="ingest")
 INGEST_LOG_LEVEL = config("INGEST_LOG_LEVEL", cast=str, default="INFO")
 POLLER_MAX_THREADS = config("POLLER_MAX_THREADS", cast=int, default=1)
+POLLER_WORKER_MODE = config(
+    "POLLER_WORKER_MODE", cast=WorkerMode, default=WorkerMode.thread
+)
 POLLER_SLEEP_SECONDS = config("POLLER_SLEEP_SECONDS", cast=int, default=5)
+POLLER_MAX_SLEEP_SECONDS = config("POLLER_MAX_SLEEP_SECONDS", cast=int, default=60)
+# on SIGTERM, how long running ingests get to finish before their jobs are released,
+# keep below the container's termination grace period (30s by default in Kubernetes)
+POLLER_DRAIN_SECONDS = config("POLLER_DRAIN_SECONDS", cast=float, default=25)
+# zmq address to listen on for the api's job notifications, e.g. tcp://*:5556
+POLLER_NOTIFY_BIND_URI = config("POLLER_NOTIFY_BIND_URI", cast=str, default="")
+# with notifications, Mongo is only polled this often as a fallback
+POLLER_FALLBACK_SECONDS = config("POLLER_FALLBACK_SECONDS", cast=int, default=30)
+POLLER_LEASE_SECONDS = config("POLLER_LEASE_SECONDS", cast=int, default=60)
+POLLER_MAX_ATTEMPTS = config("POLLER_MAX_ATTEMPTS", cast=int, default=3)
+POLLER_RETRY_BASE_SECONDS = config("POLLER_RETRY_BASE_SECONDS", cast=float, default=30)
+POLLER_RETRY_MAX_SECONDS = config("POLLER_RETRY_MAX_SECONDS", cast=float, default=3600)
+# number of most recent statuses kept on each job, 0 keeps them all
+INGEST_STATUS_HISTORY_LIMIT = config("INGEST_STATUS_HISTORY_LIMIT", cast=int, default=0)
 THUMBS_ROOT = config("THUMBS_ROOT", cast=str, default="thumbs")
 SCICAT_BASEURL = config(
     "SCICAT_BASEURL", cast=str, default="http://localhost:3000/api/v3"
@@ -38,24 +63,6 @@ def init_logging():
     logger.addHandler(ch)
 
 
-init_logging()
-
-
-logger.info("starting poller")
-logger.info(f"INGEST_DB_URI {INGEST_DB_URI}")
-logger.info(f"INGEST_DB_NAME {INGEST_DB_NAME}")
-logger.info(f"INGEST_LOG_LEVEL {INGEST_LOG_LEVEL}")
-logger.info(f"POLLER_MAX_THREADS {POLLER_MAX_THREADS}")
-logger.info(f"POLLER_SLEEP_SECONDS {POLLER_SLEEP_SECONDS}")
-logger.info(f"THUMBS_ROOT {THUMBS_ROOT}")
-logger.info(f"SCICAT_BASEURL {SCICAT_BASEURL}")
-logger.info(f"SCICAT_INGEST_USER {SCICAT_INGEST_USER}")
-logger.info("SCICAT_INGEST_PASSWORD ...")
-ingest_db = MongoClient(INGEST_DB_URI)[INGEST_DB_NAME]
-
-init_ingest_service(ingest_db)
-
-
 class TerminateRequested:
     state = False
 
@@ -68,26 +75,97 @@ def sigterm_handler(signum, frame):
     terminate_requested.state = True
 
 
-signal.signal(signal.SIGTERM, sigterm_handler)
-signal.signal(signal.SIGINT, sigterm_handler)
-
-# ingest_thread = threading.Thread(target=poll_for_new_jobs, args=(
-#     POLLER_SLEEP_SECONDS,
-#     SCICAT_BASEURL,
-#     SCICAT_INGEST_USER,
-#     SCICAT_INGEST_PASSWORD,
-#     terminate_requested,
-#     THUMBS_ROOT
-# ))
-
-# logger.info("starting polling thread")
-# ingest_thread.start()
-# ingest_thread.join()
-poll_for_new_jobs(
-    POLLER_SLEEP_SECONDS,
-    SCICAT_BASEURL,
-    SCICAT_INGEST_USER,
-    SCICAT_INGEST_PASSWORD,
-    terminate_requested,
-    THUMBS_ROOT,
-)
+def exit_abandoning_workers():
+    # worker threads can't be interrupted and would keep the interpreter alive,
+    # their jobs have already been released so just stop the process
+    for child in multiprocessing.active_children():
+        child.terminate()
+    logging.shutdown()
+    os._exit(0)
+
+
+def main():
+    init_logging()
+
+    logger.info("starting poller")
+    logger.info(f"INGEST_DB_URI {INGEST_DB_URI}")
+    logger.info(f"INGEST_DB_NAME {INGEST_DB_NAME}")
+    logger.info(f"INGEST_LOG_LEVEL {INGEST_LOG_LEVEL}")
+    logger.info(f"POLLER_MAX_THREADS {POLLER_MAX_THREADS}")
+    logger.info(f"POLLER_WORKER_MODE {POLLER_WORKER_MODE}")
+    logger.info(f"POLLER_SLEEP_SECONDS {POLLER_SLEEP_SECONDS}")
+    logger.info(f"POLLER_MAX_SLEEP_SECONDS {POLLER_MAX_SLEEP_SECONDS}")
+    logger.info(f"POLLER_DRAIN_SECONDS {POLLER_DRAIN_SECONDS}")
+    logger.info(f"POLLER_NOTIFY_BIND_URI {POLLER_NOTIFY_BIND_URI}")
+    logger.info(f"POLLER_FALLBACK_SECONDS {POLLER_FALLBACK_SECONDS}")
+    logger.info(f"POLLER_LEASE_SECONDS {POLLER_LEASE_SECONDS}")
+    logger.info(f"POLLER_MAX_ATTEMPTS {POLLER_MAX_ATTEMPTS}")
+    logger.info(f"POLLER_RETRY_BASE_SECONDS {POLLER_RETRY_BASE_SECONDS}")
+    logger.info(f"POLLER_RETRY_MAX_SECONDS {POLLER_RETRY_MAX_SECONDS}")
+    logger.info(f"INGEST_STATUS_HISTORY_LIMIT {INGEST_STATUS_HISTORY_LIMIT}")
+    logger.info(f"THUMBS_ROOT {THUMBS_ROOT}")
+    logger.info(f"SCICAT_BASEURL {SCICAT_BASEURL}")
+    logger.info(f"SCICAT_INGEST_USER {SCICAT_INGEST_USER}")
+    logger.info("SCICAT_INGEST_PASSWORD ...")
+    ingest_db = MongoClient(INGEST_DB_URI)[INGEST_DB_NAME]
+
+    service_options = dict(status_history_limit=INGEST_STATUS_HISTORY_LIMIT or None)
+    init_ingest_service(ingest_db, **service_options)
+
+    signal.signal(signal.SIGTERM, sigterm_handler)
+    signal.signal(signal.SIGINT, sigterm_handler)
+
+    job_listener = None
+    sleep_seconds = POLLER_SLEEP_SECONDS
+    if POLLER_NOTIFY_BIND_URI:
+        try:
+            job_listener = JobListener(POLLER_NOTIFY_BIND_URI)
+            sleep_seconds = POLLER_FALLBACK_SECONDS
+        except zmq.ZMQError:
+            logger.exception("could not listen for job notifications, polling instead")
+
+    poll_args = (
+        sleep_seconds,
+        SCICAT_BASEURL,
+        SCICAT_INGEST_USER,
+        SCICAT_INGEST_PASSWORD,
+        terminate_requested,
+        THUMBS_ROOT,
+    )
+    poll_kwargs = dict(
+        job_listener=job_listener,
+        lease_seconds=POLLER_LEASE_SECONDS,
+        max_sleep_interval=POLLER_MAX_SLEEP_SECONDS,
+        drain_seconds=POLLER_DRAIN_SECONDS,
+        retry_policy=RetryPolicy(
+            max_attempts=POLLER_MAX_ATTEMPTS,
+            base_seconds=POLLER_RETRY_BASE_SECONDS,
+            max_seconds=POLLER_RETRY_MAX_SECONDS,
+        ),
+    )
+    # even a single ingest runs in the pool, so the poller can stop
+    # waiting on it when the drain period runs out
+    executor = create_worker_pool(
+        max(POLLER_MAX_THREADS, 1),
+        POLLER_WORKER_MODE,
+        INGEST_DB_URI,
+        INGEST_DB_NAME,
+        INGEST_LOG_LEVEL,
+        **service_options,
+    )
+    released = poll_for_new_jobs(
+        *poll_args,
+        executor=executor,
+        max_workers=max(POLLER_MAX_THREADS, 1),
+        **poll_kwargs,
+    )
+    if released:
+        # _drain has already cancelled the futures of released jobs
+        executor.shutdown(wait=False)
+        exit_abandoning_workers()
+    executor.shutdown()
+
+
+# guarded so that spawned worker processes can import this module safely
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+import errno
+import random
+from typing import Tuple, Type
+
+from pymongo.errors import ConnectionFailure
+import requests
+
+from .scicat_clients import ScicatUnavailableError
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BASE_SECONDS = 30
+DEFAULT_RETRY_MAX_SECONDS = 3600
+
+# failures of the file or service, not of the job, that are likely to clear up
+RETRYABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    InterruptedError,
+    BlockingIOError,
+    requests.ConnectionError,
+    requests.Timeout,
+    ConnectionFailure,
+    ScicatUnavailableError,
+)
+
+# errors that name a file that isn't there or can't be read, so retrying won't help
+FATAL_ERRORS = (
+    FileNotFoundError,
+    IsADirectoryError,
+    NotADirectoryError,
+    PermissionError,
+)
+
+# OSError codes raised by stalled or flaky network file systems
+RETRYABLE_ERRNOS = {errno.EIO, errno.ESTALE, errno.ETIMEDOUT, errno.EAGAIN}
+
+
+@dataclass
+class RetryPolicy:
+    """Decides whether a failed ingest is tried again, and when
+
+    A job is attempted at most max_attempts times. After attempt n fails with
+    a retryable error, it waits base_seconds * multiplier ** (n - 1), capped at
+    max_seconds. Up to jitter of that delay is taken off at random, so jobs
+    that failed together, for example during a SciCat outage, don't all come back
+    at once.
+    """
+
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    base_seconds: float = DEFAULT_RETRY_BASE_SECONDS
+    max_seconds: float = DEFAULT_RETRY_MAX_SECONDS
+    multiplier: float = 2.0
+    jitter: float = 0.5
+    retryable_errors: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS
+    fatal_errors: Tuple[Type[BaseException], ...] = FATAL_ERRORS
+
+    def is_retryable(self, exception: BaseException) -> bool:
+        if isinstance(exception, self.fatal_errors):
+            return False
+        if isinstance(exception, self.retryable_errors):
+            return True
+        return isinstance(exception, OSError) and exception.errno in RETRYABLE_ERRNOS
+
+    def backoff(self, attempt: int) -> float:
+        """Returns the seconds to wait after the given attempt (counting from 1) failed"""
+        delay = self.base_seconds * self.multiplier ** max(attempt - 1, 0)
+        delay = min(delay, self.max_seconds)
+        return delay * (1 - self.jitter * random.random())
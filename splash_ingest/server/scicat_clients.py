@@ -0,0 +1,149 @@
+import logging
+import re
+import threading
+import time
+from urllib.parse import urljoin
+
+from pydantic import BaseModel
+import requests
+from pyscicat.client import ScicatClient, ScicatCommError, ScicatLoginError
+
+logger = logging.getLogger("splash_ingest.scicat_clients")
+
+# SciCat also rejects expired tokens with a 401, which triggers a new login,
+# so this only bounds how long a token is trusted without checking
+DEFAULT_TOKEN_TTL_SECONDS = 3600
+
+# answers from SciCat or its proxy that mean "try again later"
+UNAVAILABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class ScicatUnavailableError(ScicatCommError):
+    """SciCat could not handle a request right now, but may later"""
+
+
+class SessionScicatClient(ScicatClient):
+    """ScicatClient that reuses one HTTP session and logs in again when needed
+
+    The session pools connections to SciCat across uploads and jobs. The token is
+    renewed when it is older than token_ttl or when SciCat answers with a 401.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        timeout_seconds: int = None,
+        token_ttl: float = DEFAULT_TOKEN_TTL_SECONDS,
+    ):
+        self._session = requests.Session()
+        self._token_ttl = token_ttl
+        self._token_time = None
+        super().__init__(
+            base_url,
+            token="pending",
+            username=username,
+            password=password,
+            timeout_seconds=timeout_seconds,
+        )
+        self.login()
+
+    def login(self):
+        self._token = self._get_token()
+        self._token_time = time.monotonic()
+        self._headers["Authorization"] = "Bearer {}".format(self._token)
+
+    def _get_token(self) -> str:
+        """Logs in like pyscicat's get_token, but tells outages from rejected logins
+
+        Functional accounts log in at Users/login and other users at auth/msad,
+        so both are tried. A login carries nothing that could be at fault, so if
+        either endpoint answered with a server error, SciCat is taken to be
+        unavailable rather than the login rejected.
+        """
+        credentials = {"username": self._username, "password": self._password}
+        users_url = urljoin(self._base_url, "Users/login")
+        msad_url = urljoin(re.sub(r"/api/v\d+/?", "", self._base_url), "auth/msad")
+        unavailable_status = None
+        for url, token_field in [(users_url, "id"), (msad_url, "access_token")]:
+            response = self._session.post(
+                url, json=credentials, timeout=self._timeout_seconds, verify=True
+            )
+            if response.ok:
+                return response.json()[token_field]
+            if (
+                response.status_code in UNAVAILABLE_STATUS_CODES
+                or response.status_code >= 500
+            ):
+                unavailable_status = response.status_code
+        if unavailable_status:
+            raise ScicatUnavailableError(
+                f"SciCat unavailable ({unavailable_status}) for login"
+            )
+        logger.error(
+            f"SciCat rejected login of {self._username}: {response.status_code}"
+        )
+        raise ScicatLoginError(response.content)
+
+    @property
+    def token_expired(self) -> bool:
+        return time.monotonic() - self._token_time > self._token_ttl
+
+    def _request(self, cmd: str, endpoint: str, data: BaseModel = None):
+        return self._session.request(
+            method=cmd,
+            url=urljoin(self._base_url, endpoint),
+            json=data.dict(exclude_none=True) if data is not None else None,
+            params={"access_token": self._token},
+            headers=self._headers,
+            timeout=self._timeout_seconds,
+            stream=False,
+            verify=True,
+        )
+
+    def _send_to_scicat(self, cmd: str, endpoint: str, data: BaseModel = None):
+        if self.token_expired:
+            self.login()
+        response = self._request(cmd, endpoint, data)
+        if response.status_code == 401:
+            logger.info("SciCat rejected token, logging in again")
+            self.login()
+            response = self._request(cmd, endpoint, data)
+        if response.status_code in UNAVAILABLE_STATUS_CODES:
+            raise ScicatUnavailableError(
+                f"SciCat unavailable ({response.status_code}) for {cmd} {endpoint}"
+            )
+        return response
+
+    def close(self):
+        self._session.close()
+
+
+# requests sessions are not thread safe, so each worker thread
+# (or worker process) keeps its own clients
+_worker_clients = threading.local()
+
+
+def get_scicat_client(
+    base_url: str,
+    username: str,
+    password: str,
+    token_ttl: float = DEFAULT_TOKEN_TTL_SECONDS,
+) -> SessionScicatClient:
+    """Returns this worker's client for the given SciCat and user, logging in on first use"""
+    if not hasattr(_worker_clients, "clients"):
+        _worker_clients.clients = {}
+    key = (base_url, username, password)
+    client = _worker_clients.clients.get(key)
+    if client is None:
+        client = SessionScicatClient(base_url, username, password, token_ttl=token_ttl)
+        _worker_clients.clients[key] = client
+    return client
+
+
+def clear_scicat_clients():
+    """Closes and forgets the clients cached for the calling worker"""
+    for client in getattr(_worker_clients, "clients", {}).values():
+        client.close()
+    _worker_clients.clients = {}
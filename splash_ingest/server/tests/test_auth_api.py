@@ -1,8 +1,15 @@
+from uuid import uuid4
+
+from passlib.hash import pbkdf2_sha256
 import pytest
 from mongomock import MongoClient
 from ..api_auth_service import (
+    context,
     init_api_service,
     create_api_client,
+    legacy_key_id,
+    _key_digest,
+    revoke_api_client,
     verify_api_key,
     get_api_clients,
 )
@@ -39,3 +46,52 @@ def test_non_existent_key():
     assert api_client_key is None
     clients = get_api_clients("user1")
     assert len(clients) > 0
+
+
+def test_key_id_lookup():
+    key = create_api_client("user1", "heart_of_gold", "infinite_probability_drive")
+    key_id, _, secret = key.partition(".")
+    assert context.api_client_collection.find_one({"key_id": key_id})
+    assert verify_api_key(key).client == "heart_of_gold"
+    assert verify_api_key(key_id + ".wrong_secret") is None
+    assert verify_api_key("unknown_id." + secret) is None
+
+
+def test_legacy_key_migrated():
+    legacy_key = str(uuid4())
+    context.api_client_collection.insert_one(
+        {
+            "hashed_key": pbkdf2_sha256.hash(legacy_key),
+            "client": "marvin",
+            "api": "door_operation",
+        }
+    )
+    assert verify_api_key(legacy_key).client == "marvin"
+    migrated = context.api_client_collection.find_one({"client": "marvin"})
+    assert migrated["key_id"] == legacy_key_id(legacy_key)
+    assert verify_api_key(legacy_key).client == "marvin", "verifies after migration"
+    assert verify_api_key(str(uuid4())) is None
+
+
+def test_verified_key_cache():
+    key = create_api_client("user1", "vogon_poetry", "door_operation")
+    stats = context.verified_keys.stats()
+    assert verify_api_key(key).client == "vogon_poetry"
+    assert context.verified_keys.stats()["misses"] == stats["misses"] + 1
+    assert verify_api_key(key).client == "vogon_poetry"
+    assert context.verified_keys.stats()["hits"] == stats["hits"] + 1
+
+    key_id = key.partition(".")[0]
+    assert revoke_api_client(key_id)
+    assert verify_api_key(key) is None, "revoked key not served from cache"
+
+
+def test_key_revoked_by_another_process():
+    key = create_api_client("user1", "deep_thought", "door_operation")
+    assert verify_api_key(key).client == "deep_thought"
+
+    # as when revoked by a script, this process's cache still holds the key
+    key_id = key.partition(".")[0]
+    context.db["api_clients"].delete_one({"key_id": key_id})
+    assert verify_api_key(key) is None, "revoked key rejected by every process"
+    assert context.verified_keys.get(_key_digest(key)) is None, "dropped from cache"
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+import zmq
+
+from ..job_notifications import JobListener, JobNotifier
+
+
+def test_listener_wakes_on_notify():
+    context = zmq.Context()
+    listener = JobListener("inproc://job_notifications", context=context)
+    notifier = JobNotifier(["inproc://job_notifications"], context=context)
+    try:
+        assert not listener.wait(0.01), "nothing published yet"
+
+        # subscriptions propagate asynchronously, so publish until one arrives
+        woken = False
+        for _ in range(50):
+            notifier.notify("42")
+            if listener.wait(0.05):
+                woken = True
+                break
+        assert woken, "listener wakes when a job is published"
+
+        notifier.notify("43")
+        notifier.notify("44")
+        time.sleep(0.05)
+        assert listener.wait(0.5), "queued notifications wake the listener"
+        assert not listener.wait(0.01), "queued notifications consumed by one wait"
+    finally:
+        listener.close()
+        notifier.close()
+        context.term()
+
+
+def test_notifiers_share_a_listener():
+    context = zmq.Context()
+    listener = JobListener("inproc://shared_notifications", context=context)
+    notifiers = [
+        JobNotifier(["inproc://shared_notifications"], context=context)
+        for _ in range(2)
+    ]
+    try:
+        for notifier in notifiers:
+            woken = False
+            for _ in range(50):
+                notifier.notify("42")
+                if listener.wait(0.05):
+                    woken = True
+                    break
+            assert woken, "each api worker can publish to the poller"
+    finally:
+        for notifier in notifiers:
+            notifier.close()
+        listener.close()
+        context.term()
+
+
+def test_listener_address_in_use():
+    context = zmq.Context()
+    listener = JobListener("inproc://busy_notifications", context=context)
+    try:
+        with pytest.raises(zmq.ZMQError):
+            JobListener("inproc://busy_notifications", context=context)
+    finally:
+        listener.close()
+        context.term()
@@ -0,0 +1,84 @@
+from pyscicat.client import ScicatLoginError
+import pytest
+import requests_mock
+
+from ..retry_policy import RetryPolicy
+from ..scicat_clients import (
+    clear_scicat_clients,
+    get_scicat_client,
+    ScicatUnavailableError,
+)
+
+SCICAT_URL = "http://localhost:3000/api/v3"
+
+
+@pytest.fixture
+def mock_scicat():
+    clear_scicat_clients()
+    with requests_mock.Mocker() as mock_request:
+        mock_request.post(SCICAT_URL + "/Users/login", json={"id": "token_1"})
+        yield mock_request
+    clear_scicat_clients()
+
+
+def login_count(mock_request):
+    return len(
+        [
+            request
+            for request in mock_request.request_history
+            if request.path.endswith("/users/login")
+        ]
+    )
+
+
+def test_client_reused(mock_scicat):
+    mock_scicat.get(SCICAT_URL + "/Datasets/42", json={"pid": "42"})
+    client = get_scicat_client(SCICAT_URL, "ingest", "secret")
+    assert get_scicat_client(SCICAT_URL, "ingest", "secret") is client
+    assert get_scicat_client(SCICAT_URL, "other", "secret") is not client
+
+    client.datasets_get_one("42")
+    client.datasets_get_one("42")
+    assert login_count(mock_scicat) == 2, "one login per user, not per call"
+
+
+def test_relogin_on_401(mock_scicat):
+    client = get_scicat_client(SCICAT_URL, "ingest", "secret")
+    mock_scicat.post(SCICAT_URL + "/Users/login", json={"id": "token_2"})
+    mock_scicat.get(
+        SCICAT_URL + "/Datasets/42",
+        [{"status_code": 401, "json": {}}, {"json": {"pid": "42"}}],
+    )
+    assert client.datasets_get_one("42") == {"pid": "42"}
+    assert login_count(mock_scicat) == 2
+    assert mock_scicat.last_request.qs["access_token"] == ["token_2"]
+
+
+def test_relogin_on_token_expiry(mock_scicat):
+    mock_scicat.get(SCICAT_URL + "/Datasets/42", json={"pid": "42"})
+    client = get_scicat_client(SCICAT_URL, "ingest", "secret", token_ttl=0)
+    client.datasets_get_one("42")
+    assert login_count(mock_scicat) == 2
+
+
+def test_unavailable_raised(mock_scicat):
+    mock_scicat.get(SCICAT_URL + "/Datasets/42", status_code=502, text="Bad Gateway")
+    client = get_scicat_client(SCICAT_URL, "ingest", "secret")
+    with pytest.raises(ScicatUnavailableError):
+        client.datasets_get_one("42")
+
+
+def test_unavailable_at_login(mock_scicat):
+    mock_scicat.post(SCICAT_URL + "/Users/login", status_code=502, text="Bad Gateway")
+    mock_scicat.post("http://localhost:3000/auth/msad", status_code=401, json={})
+    with pytest.raises(ScicatUnavailableError) as exc_info:
+        get_scicat_client(SCICAT_URL, "ingest", "secret")
+    assert RetryPolicy().is_retryable(exc_info.value)
+
+
+def test_login_rejected(mock_scicat):
+    mock_scicat.post(SCICAT_URL + "/Users/login", status_code=401, json={})
+    mock_scicat.post("http://localhost:3000/auth/msad", status_code=401, json={})
+    with pytest.raises(ScicatLoginError) as exc_info:
+        get_scicat_client(SCICAT_URL, "ingest", "wrong")
+    assert not RetryPolicy().is_retryable(exc_info.value)
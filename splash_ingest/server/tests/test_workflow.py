@@ -1,21 +1,46 @@
 import datetime
+import logging
+import signal
+import threading
+import time
+
 import h5py
 import pytest
 from mongomock import MongoClient
+from pymongo.errors import AutoReconnect
 from splash_ingest.server.api_auth_service import (
     create_api_client,
     init_api_service as init_api_key,
 )
 from splash_ingest.server.model import IngestType
+from .. import ingest_service
 from ..ingest_service import (
+    claim_job,
+    create_worker_pool,
     find_job,
+    find_job_statuses,
+    find_new_status_items,
+    find_next_jobs,
     find_unstarted_jobs,
+    find_poller_stats,
+    ingest,
     init_ingest_service,
+    PollBackoff,
+    poll_for_new_jobs,
+    query_jobs,
+    reclaim_expired_jobs,
+    renew_job_leases,
+    report_poller_stats,
     service_context,
     create_job,
+    create_jobs,
+    file_dedup_key,
+    find_or_create_job,
     set_job_status,
 )
-from ..model import JobStatus, StatusItem
+from ..model import DedupMode, JobStatus, StatusItem
+from ..retry_policy import RetryPolicy
+from splash_ingest.ingestors.utils import stage
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -30,7 +55,7 @@ def test_jobs_init():
     assert (
         service_context.ingest_jobs is not None
     ), "test that init creates a collection"
-    assert len(service_context.ingest_jobs.index_information()) == 4
+    assert len(service_context.ingest_jobs.index_information()) == 10
 
 
 def test_job_create():
@@ -50,6 +75,97 @@ def test_job_create():
     ), "return Job gets provided submitter"
 
 
+def test_create_jobs_partial_failure(monkeypatch):
+    existing_job = create_job("user1", "/foo/1.hdf5", "magrathia", [IngestType.scicat])
+    new_ids = iter(["new_job_1", existing_job.id, "new_job_2"])
+    monkeypatch.setattr(ingest_service, "uuid4", lambda: next(new_ids))
+
+    results = create_jobs(
+        "user1",
+        [
+            ("/foo/2.hdf5", "magrathia", [IngestType.scicat]),
+            ("/foo/3.hdf5", "magrathia", [IngestType.scicat]),
+            ("/foo/4.hdf5", "magrathia", [IngestType.scicat]),
+        ],
+    )
+    assert results[0][0].id == "new_job_1"
+    assert results[1][0] is None and results[1][2], "duplicate id reported"
+    assert results[2][0].id == "new_job_2", "later jobs still inserted"
+    assert find_job("new_job_2").document_path == "/foo/4.hdf5"
+
+
+def test_failed_insert_releases_fair_share(monkeypatch):
+    def lost_connection(*args, **kwargs):
+        raise AutoReconnect("connection lost")
+
+    monkeypatch.setattr(service_context.ingest_jobs, "insert_many", lost_connection)
+    monkeypatch.setattr(service_context.ingest_jobs, "insert_one", lost_connection)
+    with pytest.raises(AutoReconnect):
+        create_jobs("ford", [("/foo/1.hdf5", "guide", [IngestType.scicat])] * 3)
+    with pytest.raises(AutoReconnect):
+        create_job("ford", "/foo/2.hdf5", "guide", [IngestType.scicat])
+    with pytest.raises(AutoReconnect):
+        find_or_create_job("ford", "/foo/3.hdf5", "guide", [IngestType.scicat], "key")
+    flow = service_context.ingest_fair_share.find_one(
+        {"submitter": "ford", "mapping_id": "guide"}
+    )
+    assert flow["finish_tag"] == 0.0, "no fair share charged for jobs not inserted"
+
+
+def test_file_dedup_key(tmp_path):
+    data_file = tmp_path / "scan.hdf5"
+    data_file.write_bytes(b"forty two")
+    key = file_dedup_key("magrathia", str(data_file))
+    assert key == file_dedup_key("magrathia", str(data_file))
+    assert key != file_dedup_key("heart_of_gold", str(data_file)), "keyed by mapping"
+    assert file_dedup_key("magrathia", str(data_file), DedupMode.none) is None
+    assert file_dedup_key("magrathia", str(tmp_path / "missing.hdf5")) is None
+
+    copy = tmp_path / "copy.hdf5"
+    copy.write_bytes(b"forty two")
+    assert file_dedup_key(
+        "magrathia", str(data_file), DedupMode.content
+    ) == file_dedup_key("magrathia", str(copy), DedupMode.content)
+
+
+def test_dedup_jobs_coalesced():
+    job, coalesced = find_or_create_job(
+        "user1", "/foo/dedup.hdf5", "magrathia", [IngestType.scicat], "dedup_1"
+    )
+    assert not coalesced
+    same_job, coalesced = find_or_create_job(
+        "user2", "/foo/dedup.hdf5", "magrathia", [IngestType.scicat], "dedup_1"
+    )
+    assert coalesced and same_job.id == job.id
+
+    results = create_jobs(
+        "user1",
+        [
+            ("/foo/dedup.hdf5", "magrathia", [IngestType.scicat], "dedup_1"),
+            ("/foo/dedup_2.hdf5", "magrathia", [IngestType.scicat], "dedup_2"),
+            ("/foo/dedup_2.hdf5", "magrathia", [IngestType.scicat], "dedup_2"),
+            ("/foo/plain.hdf5", "magrathia", [IngestType.scicat]),
+        ],
+    )
+    assert results[0][0].id == job.id and results[0][1]
+    assert not results[1][1] and results[1][2] is None
+    assert results[2][0].id == results[1][0].id and results[2][1], "within a batch"
+    assert not results[3][1] and results[3][0].dedup_key is None
+
+    # a failed job releases its key, so the file can be submitted again
+    set_job_status(
+        job.id,
+        StatusItem(
+            time=datetime.datetime.utcnow(), submitter="system", status=JobStatus.error
+        ),
+    )
+    assert find_job(job.id).dedup_key is None
+    new_job, coalesced = find_or_create_job(
+        "user1", "/foo/dedup.hdf5", "magrathia", [IngestType.scicat], "dedup_1"
+    )
+    assert not coalesced and new_job.id != job.id
+
+
 def test_update_non_existant_job():
     result = set_job_status(
         "42",
@@ -62,6 +178,122 @@ def test_update_non_existant_job():
     assert not result, "tested return code for non-existent job"
 
 
+def test_status_transition_times():
+    job = create_job("user1", "/foo/times.hdf5", "magrathia", [IngestType.scicat])
+    started = datetime.datetime.utcnow()
+    set_job_status(
+        job.id, StatusItem(time=started, submitter="system", status=JobStatus.running)
+    )
+    finished = started + datetime.timedelta(seconds=1)
+    set_job_status(
+        job.id,
+        StatusItem(time=finished, submitter="system", status=JobStatus.successful),
+    )
+    job = find_job(job.id)
+    assert abs(job.start_time - started) < datetime.timedelta(milliseconds=1)
+    assert abs(job.end_time - finished) < datetime.timedelta(milliseconds=1)
+    assert job.submitter == "user1", "status changes keep the job's submitter"
+    assert [status.status for status in job.status_history] == [
+        JobStatus.submitted,
+        JobStatus.running,
+        JobStatus.successful,
+    ]
+
+
+def test_new_status_items_beyond_window():
+    job = create_job("user1", "/foo/window.hdf5", "magrathia", [IngestType.scicat])
+    start = datetime.datetime.utcnow()
+    for second in range(30):
+        set_job_status(
+            job.id,
+            StatusItem(
+                time=start + datetime.timedelta(seconds=second + 1),
+                submitter="system",
+                status=JobStatus.running,
+                log=str(second),
+            ),
+        )
+    _, first, status_items = find_new_status_items(job.id)
+    assert (first, len(status_items)) == (0, 31), "the whole history without after"
+    _, first, status_items = find_new_status_items(job.id, 2)
+    assert first == 3
+    assert [item.log for item in status_items] == [str(n) for n in range(2, 30)]
+    _, first, status_items = find_new_status_items(job.id, 28)
+    assert first == 29
+    assert [item.log for item in status_items] == ["28", "29"]
+    _, first, status_items = find_new_status_items(job.id, 30)
+    assert (first, status_items) == (31, [])
+
+
+def test_new_status_items_from_clocks_behind():
+    job = create_job("user1", "/foo/behind.hdf5", "magrathia", [IngestType.scicat])
+    # a poller whose clock is behind the api host that stamped submitted
+    behind = job.submit_time - datetime.timedelta(seconds=5)
+    for status in [JobStatus.running, JobStatus.successful]:
+        set_job_status(
+            job.id, StatusItem(time=behind, submitter="system", status=status)
+        )
+    status, first, status_items = find_new_status_items(job.id, 0)
+    assert status == JobStatus.successful
+    assert first == 1
+    assert [item.status for item in status_items] == [
+        JobStatus.running,
+        JobStatus.successful,
+    ]
+
+
+def test_status_history_limit(monkeypatch):
+    monkeypatch.setattr(service_context, "status_history_limit", 2)
+    job = create_job("user1", "/foo/limit.hdf5", "magrathia", [IngestType.scicat])
+    for log in ["first", "second", "third"]:
+        set_job_status(
+            job.id,
+            StatusItem(
+                time=datetime.datetime.utcnow(),
+                submitter="system",
+                status=JobStatus.running,
+                log=log,
+            ),
+        )
+    job = find_job(job.id)
+    assert [status.log for status in job.status_history] == ["second", "third"]
+    finished = datetime.datetime.utcnow()
+    assert set_job_status(
+        job.id,
+        StatusItem(
+            time=finished,
+            submitter="system",
+            status=JobStatus.successful,
+            log="finished",
+        ),
+    )
+    job = find_job(job.id)
+    assert [status.log for status in job.status_history] == ["third", "finished"]
+    assert job.status == JobStatus.successful
+    assert abs(job.end_time - finished) < datetime.timedelta(milliseconds=1)
+    # trimmed items keep their numbers
+    assert job.status_count == 5
+    _, first, status_items = find_new_status_items(job.id, 3)
+    assert first == 4
+    assert [item.log for item in status_items] == ["finished"]
+
+
+def test_inserted_jobs_stamped_by_server(monkeypatch):
+    class FastClock(datetime.datetime):
+        # the clock of an api host running an hour ahead of the database
+        @classmethod
+        def utcnow(cls):
+            return datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    monkeypatch.setattr(ingest_service, "datetime", FastClock)
+    job = create_job("user1", "/foo/ahead.hdf5", "ahead", [IngestType.scicat])
+    [(batch_job, _, _)] = create_jobs(
+        "user1", [("/foo/ahead_2.hdf5", "ahead", [IngestType.scicat])]
+    )
+    _, watermark = find_job_statuses([job.id, batch_job.id])
+    assert watermark < job.submit_time - datetime.timedelta(minutes=30)
+
+
 def test_query_unstarted_jobs():
     document_path = "/foo/bar.hdf5"
 
@@ -100,6 +332,446 @@ def test_query_unstarted_jobs():
     assert len(jobs) == 0, "all jobs should be set to started"
 
 
+def test_claim_job():
+    document_path = "/foo/bar.hdf5"
+    job = create_job("user1", document_path, "magrathia", [IngestType.databroker])
+
+    claimed_job = claim_job("deep_thought")
+    assert claimed_job.id == job.id, "only submitted job is claimed"
+    assert claimed_job.status == JobStatus.running
+    assert claimed_job.start_time is not None
+    assert claimed_job.status_history == [], "history not loaded to claim"
+    persisted_job = find_job(job.id)
+    assert persisted_job.status == JobStatus.running
+    assert persisted_job.status_history[-1].submitter == "deep_thought"
+
+    assert claim_job("deep_thought") is None, "a running job can't be claimed again"
+
+
+def test_next_jobs_in_submit_order():
+    first = create_job("user1", "/foo/1.hdf5", "magrathia", [IngestType.scicat])
+    second = create_job("user1", "/foo/2.hdf5", "magrathia", [IngestType.scicat])
+    third = create_job("user1", "/foo/3.hdf5", "magrathia", [IngestType.scicat])
+
+    next_jobs = find_next_jobs(limit=2)
+    assert [job.id for job in next_jobs] == [first.id, second.id], "oldest first"
+    assert next_jobs[0].status_history == [], "history projected out"
+
+    assert claim_job("deep_thought").id == first.id
+    assert claim_job("deep_thought").id == second.id
+    assert claim_job("deep_thought").id == third.id
+    assert claim_job("deep_thought") is None
+
+
+def test_expired_lease_reclaimed():
+    job = create_job("user1", "/foo/lease.hdf5", "magrathia", [IngestType.scicat])
+
+    claimed_job = claim_job("system", "worker_1", lease_seconds=60)
+    assert claimed_job.worker_id == "worker_1"
+    assert claimed_job.attempts == 1
+    assert reclaim_expired_jobs(max_attempts=2) == 0, "live lease not reclaimed"
+    assert renew_job_leases([job.id], "worker_2") == 0, "only holder renews"
+    assert renew_job_leases([job.id], "worker_1") == 1
+
+    # worker_1 dies and its lease runs out
+    service_context.ingest_jobs.update_one(
+        {"id": job.id},
+        {"$set": {"lease_expires": datetime.datetime.utcnow()}},
+    )
+    time.sleep(0.01)
+    assert reclaim_expired_jobs(max_attempts=2) == 1
+    requeued_job = find_job(job.id)
+    assert requeued_job.status == JobStatus.submitted
+    assert requeued_job.worker_id is None
+    assert requeued_job.status_history[-1].log.startswith("Lease expired")
+
+    # a late status from worker_1 can't overwrite the requeued job
+    late_status = StatusItem(
+        time=datetime.datetime.utcnow(), submitter="system", status=JobStatus.successful
+    )
+    assert not set_job_status(job.id, late_status, "worker_1")
+
+    # second attempt also abandoned, so the job is given up on
+    claim_job("system", "worker_2", lease_seconds=0)
+    time.sleep(0.01)
+    assert reclaim_expired_jobs(max_attempts=2) == 0
+    dead_job = find_job(job.id)
+    assert dead_job.status == JobStatus.dead_letter
+    assert dead_job.attempts == 2
+
+
+class FlakyIngestor:
+    def __init__(self, error):
+        self.error = error
+
+    def ingest(self, *args):
+        raise self.error
+
+
+def run_attempt(job_id, worker_id, retry_policy):
+    service_context.ingest_jobs.update_one(
+        {"id": job_id},
+        {
+            "$set": {"status": JobStatus.running, "worker_id": worker_id},
+            "$inc": {"attempts": 1},
+        },
+    )
+    ingest("system", find_job(job_id), "thumbs", retry_policy=retry_policy)
+    return find_job(job_id)
+
+
+def test_retry_with_backoff(monkeypatch):
+    monkeypatch.setattr(ingest_service, "get_scicat_client", lambda *args: None)
+    monkeypatch.setitem(
+        ingest_service.ingestor_modules,
+        "flaky",
+        FlakyIngestor(ConnectionResetError("SciCat went away")),
+    )
+    retry_policy = RetryPolicy(max_attempts=2, base_seconds=60, jitter=0)
+    job = create_job("user1", "/foo/flaky.hdf5", "flaky", [IngestType.scicat])
+
+    before_retry = datetime.datetime.utcnow()
+    job = run_attempt(job.id, "worker_1", retry_policy)
+    assert job.status == JobStatus.submitted
+    assert job.worker_id is None
+    assert job.not_before >= before_retry + datetime.timedelta(seconds=59)
+    assert job.status_history[-1].log.startswith("Attempt 1 failed")
+    next_ids = [next_job.id for next_job in find_next_jobs(limit=1000)]
+    assert job.id not in next_ids, "not claimable during backoff"
+
+    service_context.ingest_jobs.update_one(
+        {"id": job.id}, {"$set": {"not_before": datetime.datetime.utcnow()}}
+    )
+    next_ids = [next_job.id for next_job in find_next_jobs(limit=1000)]
+    assert job.id in next_ids, "claimable once backoff has passed"
+
+    job = run_attempt(job.id, "worker_2", retry_policy)
+    assert job.status == JobStatus.dead_letter
+    assert job.end_time is not None
+    assert job.status_history[-1].log.startswith("Giving up after 2 attempts")
+
+
+class TimedIngestor:
+    def ingest(self, scicat_client, username, file_path, thumbs_dir, issues):
+        with stage("open_hdf5"):
+            pass
+        with stage("upload_dataset"):
+            time.sleep(0.01)
+        return "dataset_42"
+
+
+def test_stage_timings_recorded(monkeypatch):
+    monkeypatch.setattr(ingest_service, "get_scicat_client", lambda *args: None)
+    monkeypatch.setitem(ingest_service.ingestor_modules, "timed", TimedIngestor())
+    job = create_job("user1", "/foo/timed.hdf5", "timed", [IngestType.scicat])
+    job = run_attempt(job.id, "worker_1", RetryPolicy())
+    assert job.status == JobStatus.successful
+    assert [timing.name for timing in job.stage_timings] == [
+        "scicat_login",
+        "open_hdf5",
+        "upload_dataset",
+    ]
+    assert job.stage_timings[2].wall_seconds >= 0.01
+    assert "stage timings:\nupload_dataset: " in job.status_history[-1].log
+
+
+def test_fatal_error_not_retried(monkeypatch):
+    monkeypatch.setattr(ingest_service, "get_scicat_client", lambda *args: None)
+    monkeypatch.setitem(
+        ingest_service.ingestor_modules,
+        "missing",
+        FlakyIngestor(FileNotFoundError("/foo/missing.hdf5")),
+    )
+    job = create_job("user1", "/foo/missing.hdf5", "missing", [IngestType.scicat])
+    job = run_attempt(job.id, "worker_1", RetryPolicy(max_attempts=3))
+    assert job.status == JobStatus.error
+
+
+def test_retry_policy_backoff():
+    retry_policy = RetryPolicy(base_seconds=10, max_seconds=30, jitter=0.5)
+    for attempt, full_delay in [(1, 10), (2, 20), (3, 30), (10, 30)]:
+        delay = retry_policy.backoff(attempt)
+        assert full_delay / 2 <= delay <= full_delay
+    assert retry_policy.is_retryable(OSError(5, "Input/output error"))
+    assert not retry_policy.is_retryable(ValueError("bad mapping"))
+
+
+@pytest.fixture
+def scheduling_db():
+    # an empty queue, so claim order only depends on this test's jobs
+    MongoClient().drop_database("scheduling_db")
+    init_ingest_service(
+        MongoClient().scheduling_db, mapping_weights={"live": 2.0, "backfill": 0.5}
+    )
+    yield
+    init_ingest_service(MongoClient().ingest_db)
+
+
+def test_fair_share_claim_order(scheduling_db):
+    create_jobs(
+        "archivist",
+        [(f"/old/{x}.hdf5", "backfill", [IngestType.scicat]) for x in range(20)],
+    )
+    live_jobs = {
+        create_job("beamline", f"/new/{x}.hdf5", "live", [IngestType.scicat]).id
+        for x in range(4)
+    }
+    urgent_job = create_job(
+        "beamline", "/new/urgent.hdf5", "backfill", [IngestType.scicat], priority=5
+    )
+
+    claimed = [claim_job("system").id for _ in range(6)]
+    assert claimed[0] == urgent_job.id, "highest priority first"
+    assert live_jobs <= set(claimed), "live jobs not stuck behind the backfill"
+
+    # the backfill keeps draining once live jobs are done
+    assert all(
+        find_job(claim_job("system").id).mapping_id == "backfill" for _ in range(5)
+    )
+
+    # a flow that was idle starts at the virtual time, not with banked credit
+    late_job = create_job("beamline", "/new/late.hdf5", "live", [IngestType.scicat])
+    assert claim_job("system").id == late_job.id
+
+
+def test_priority_claim_keeps_virtual_time(scheduling_db):
+    create_jobs(
+        "archivist",
+        [(f"/old/{x}.hdf5", "other", [IngestType.scicat]) for x in range(200)],
+    )
+    urgent_job = create_job(
+        "archivist", "/old/urgent.hdf5", "other", [IngestType.scicat], priority=5
+    )
+    assert urgent_job.fair_share_tag == 200
+    assert claim_job("system").id == urgent_job.id
+
+    # the urgent job's tag doesn't push a new flow behind the whole backfill
+    live_job = create_job("beamline", "/new/1.hdf5", "other", [IngestType.scicat])
+    claimed = [claim_job("system").id for _ in range(2)]
+    assert live_job.id in claimed
+
+
+def test_coalesced_jobs_take_no_fair_share(scheduling_db, tmp_path):
+    data_file = tmp_path / "scan.hdf5"
+    data_file.write_bytes(b"forty two")
+    dedup_key = file_dedup_key("other", str(data_file))
+    job_request = (str(data_file), "other", [IngestType.scicat], dedup_key)
+    find_or_create_job("user1", *job_request)
+    for _ in range(2):
+        find_or_create_job("user1", *job_request)
+    create_jobs("user1", [job_request, job_request])
+    flow = service_context.ingest_fair_share.find_one(
+        {"submitter": "user1", "mapping_id": "other"}
+    )
+    assert flow["finish_tag"] == 1.0, "only the inserted job advances the flow"
+
+
+def test_mapping_weights_validated():
+    with pytest.raises(ValueError):
+        init_ingest_service(MongoClient().ingest_db, mapping_weights={"live": 0})
+    init_ingest_service(MongoClient().ingest_db)
+
+
+def test_jobs_without_priority_backfilled(scheduling_db):
+    legacy_job = create_job("user1", "/old/legacy.hdf5", "live", [IngestType.scicat])
+    service_context.ingest_jobs.update_one(
+        {"id": legacy_job.id},
+        {"$unset": {"priority": "", "fair_share_tag": "", "status_count": ""}},
+    )
+    init_ingest_service(service_context.db)
+    create_job("user1", "/new/1.hdf5", "live", [IngestType.scicat])
+    assert find_job(legacy_job.id).priority == 0
+    assert find_job(legacy_job.id).status_count == 1, "counted from the history"
+    assert claim_job("system").id == legacy_job.id, "queued jobs keep their place"
+
+
+def test_query_jobs_pages():
+    job_ids = []
+    for x in range(5):
+        job = create_job(
+            "zaphod", f"/foo/{x}.hdf5", "heart_of_gold", [IngestType.scicat]
+        )
+        job_ids.append(job.id)
+        time.sleep(0.002)  # distinct submit times at Mongo's millisecond precision
+    claim_job("system")  # oldest of zaphod's jobs is now running
+    seen = []
+    page = query_jobs(submitter="zaphod", limit=2)
+    while True:
+        assert len(page.jobs) <= 2
+        seen.extend(page.jobs)
+        if not page.next_cursor:
+            break
+        page = query_jobs(submitter="zaphod", limit=2, cursor=page.next_cursor)
+    assert [job.id for job in seen] == list(reversed(job_ids)), "newest first"
+    assert all(job.status_history is None for job in seen), "summaries by default"
+
+    running = query_jobs(statuses=[JobStatus.running], submitter="zaphod")
+    assert [job.id for job in running.jobs] == [job_ids[0]]
+    submitted = query_jobs(
+        statuses=[JobStatus.submitted], mapping_id="heart_of_gold", limit=10
+    )
+    assert len(submitted.jobs) == 4 and submitted.next_cursor is None
+    with_history = query_jobs(submitter="zaphod", limit=1, include_history=True)
+    assert len(with_history.jobs[0].status_history) == 1
+
+    while claim_job("system"):
+        pass
+
+
+def test_poll_with_worker_pool(monkeypatch):
+    lock = threading.Lock()
+    running = []
+    max_running = []
+    ingested = []
+
+    def fake_ingest(submitter, job, *args):
+        with lock:
+            running.append(job.id)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(job.id)
+            ingested.append(job.id)
+
+    monkeypatch.setattr(ingest_service, "ingest", fake_ingest)
+    job_ids = {
+        create_job("user1", f"/foo/{x}.hdf5", "magrathia", [IngestType.scicat]).id
+        for x in range(6)
+    }
+
+    class TerminateWhenDrained:
+        @property
+        def state(self):
+            return len(find_unstarted_jobs()) == 0
+
+    with create_worker_pool(3) as executor:
+        poll_for_new_jobs(
+            0.01,
+            None,
+            None,
+            None,
+            TerminateWhenDrained(),
+            executor=executor,
+            max_workers=3,
+        )
+    assert set(ingested) == job_ids, "in-flight jobs finish before returning"
+    assert max(max_running) <= 3, "in-flight work bounded by max_workers"
+    assert max(max_running) > 1, "jobs ran concurrently"
+
+
+def test_poll_drains_on_terminate(monkeypatch, scheduling_db):
+    finish_slow_jobs = threading.Event()
+
+    def fake_ingest(submitter, job, *args):
+        if job.document_path.startswith("/slow"):
+            finish_slow_jobs.wait(10)
+
+    monkeypatch.setattr(ingest_service, "ingest", fake_ingest)
+    slow_job = create_job("user1", "/slow/1.hdf5", "magrathia", [IngestType.scicat])
+    create_job("user1", "/fast/1.hdf5", "magrathia", [IngestType.scicat])
+
+    class TerminateWhenClaimed:
+        @property
+        def state(self):
+            return len(find_unstarted_jobs()) == 0
+
+    with create_worker_pool(2) as executor:
+        released = poll_for_new_jobs(
+            0.01,
+            None,
+            None,
+            None,
+            TerminateWhenClaimed(),
+            executor=executor,
+            max_workers=2,
+            worker_id="draining_worker",
+            drain_seconds=0.1,
+        )
+        assert released == [slow_job.id], "only the unfinished job is released"
+        job = find_job(slow_job.id)
+        assert job.status == JobStatus.submitted
+        assert job.worker_id is None
+        assert job.attempts == 0, "interrupted attempt not counted"
+        finish_slow_jobs.set()
+
+
+def test_worker_processes_ignore_interrupt(monkeypatch):
+    handlers = {}
+    monkeypatch.setattr(
+        signal, "signal", lambda signum, handler: handlers.update({signum: handler})
+    )
+    monkeypatch.setattr(ingest_service, "MongoClient", MongoClient)
+    monkeypatch.setattr(logging.getLogger("splash_ingest"), "handlers", [])
+    monkeypatch.setattr(logging.getLogger("splash_ingest"), "level", logging.NOTSET)
+    try:
+        ingest_service._init_worker_process(
+            "mongodb://localhost", "worker_db", "INFO", {}
+        )
+    finally:
+        init_ingest_service(MongoClient().ingest_db)
+    # Ctrl-C stops the poller, which drains the workers' ingests
+    assert handlers == {signal.SIGINT: signal.SIG_IGN}
+
+
+def test_poller_stats_removed_on_stop():
+    report_poller_stats(PollBackoff("stopping_worker", 1, 1).stats())
+    assert "stopping_worker" in [stats.worker_id for stats in find_poller_stats()]
+
+    class TerminateNow:
+        state = True
+
+    poll_for_new_jobs(
+        0.01, None, None, None, TerminateNow(), worker_id="stopping_worker"
+    )
+    assert "stopping_worker" not in [stats.worker_id for stats in find_poller_stats()]
+    ttl_index = service_context.ingest_pollers.index_information()["last_updated_1"]
+    assert ttl_index["expireAfterSeconds"] == ingest_service.POLLER_STATS_TTL_SECONDS
+
+
+def test_poll_backoff():
+    poll_backoff = PollBackoff("worker_1", 1, 5)
+    poll_backoff.found_nothing()
+    assert poll_backoff.interval == 1, "first empty poll waits the normal interval"
+    poll_backoff.found_nothing()
+    assert poll_backoff.interval == 2
+    poll_backoff.failed(ConnectionError("mongo down"))
+    poll_backoff.failed(ConnectionError("mongo down"))
+    assert poll_backoff.interval == 5, "capped at max_interval"
+    stats = poll_backoff.stats()
+    assert stats.consecutive_failures == 2
+    assert stats.last_error == "ConnectionError('mongo down')"
+
+    report_poller_stats(stats)
+    reported = {stats.worker_id: stats for stats in find_poller_stats()}
+    assert reported["worker_1"].current_interval == 5
+    assert reported["worker_1"].last_updated is not None
+
+    poll_backoff.found_work()
+    assert poll_backoff.interval == 1
+    assert poll_backoff.stats().consecutive_failures == 0
+
+
+def test_poll_waits_after_errors(monkeypatch):
+    poll_times = []
+
+    def failing_claim(*args):
+        poll_times.append(time.monotonic())
+        raise ConnectionError("mongo down")
+
+    monkeypatch.setattr(ingest_service, "claim_job", failing_claim)
+
+    class TerminateAfterPolls:
+        @property
+        def state(self):
+            return len(poll_times) >= 3
+
+    poll_for_new_jobs(
+        0.02, None, None, None, TerminateAfterPolls(), max_sleep_interval=0.08
+    )
+    assert poll_times[1] - poll_times[0] >= 0.04
+    assert poll_times[2] - poll_times[1] >= 0.08
+
+
 @pytest.fixture
 def sample_file(tmp_path):
     file = h5py.File(tmp_path / "test.hdf5", "w")
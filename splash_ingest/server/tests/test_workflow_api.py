@@ -1,64 +1,407 @@
-# from fastapi.testclient import TestClient
-# from mongomock import MongoClient
-# import pymongo
-# import pytest
-
-# from splash_ingest.server.api import (
-#     app,
-#     CreateJobRequest,
-#     CreateJobResponse,
-# )
-# from splash_ingest.server.api_auth_service import create_api_client, init_api_service
-# from splash_ingest.server.ingest_service import init_ingest_service
-# from ..model import IngestType, Job
-# from ..api import INGEST_JOBS_API, API_KEY_NAME
-
-
-# @pytest.fixture()
-# def client():
-#     client = TestClient(app)
-#     return client
-
-
-# def ingest_db(mongo_client):
-#     return MongoClient().ingest_db
-
-
-# def init_svc():
-#     mongo_client = pymongo.MongoClient()
-#     init_ingest_service(ingest_db(mongo_client))
-#     init_api_service(ingest_db(mongo_client))
-
-
-# def test_create_job_api(client: TestClient):
-#     init_svc()
-#     key = create_api_client("user1", "sirius_cybernetics_gpp", INGEST_JOBS_API)
-#     request = CreateJobRequest(
-#         file_path="/foo/bar.hdf5",
-#         mapping_name="beamline_mappings",
-#         mapping_version="42",
-#         ingest_types=[IngestType.databroker, IngestType.scicat],
-#     )
-#     response: CreateJobResponse = client.post(
-#         url="/api/ingest/jobs", json=request.dict(), headers={API_KEY_NAME: key}
-#     )
-#     assert response.status_code == 200, f"failed with message {response.content}"
-#     job_id = response.json()["job_id"]
-
-#     response = client.get(url="/api/ingest/jobs/" + job_id)
-#     assert response.status_code == 403, "ingest jobs wihtout api key"
-
-#     response = client.get(
-#         url="/api/ingest/jobs/" + job_id + "?" + API_KEY_NAME + "=" + key
-#     )
-#     job = Job(**response.json())
-#     assert job.document_path == "/foo/bar.hdf5"
-
-
-# def test_job_not_found(client: TestClient):
-#     init_svc()
-#     key = create_api_client("user1", "sirius_cybernetics_gpp", INGEST_JOBS_API)
-#     response = client.get(
-#         url="/api/ingest/jobs/BAD_ID" + "?" + API_KEY_NAME + "=" + key
-#     )
-#     assert response.status_code == 404, "404 with unknown job id"
+import asyncio
+import datetime
+import threading
+
+from fastapi.testclient import TestClient
+import mongomock
+from mongomock import MongoClient
+import pytest
+
+from splash_ingest.server.api import (
+    app,
+    CreateJobRequest,
+    CreateJobResponse,
+)
+from splash_ingest.server.api_auth_service import (
+    context as api_auth_context,
+    create_api_client,
+    init_api_service,
+)
+from splash_ingest.server import api, ingest_service
+from splash_ingest.server.ingest_service import (
+    create_job,
+    file_dedup_key,
+    find_modified_times,
+    init_ingest_service,
+    PollBackoff,
+    report_poller_stats,
+    set_job_status,
+)
+from ..model import IngestType, Job, JobStatus, StatusItem
+from ..api import INGEST_JOBS_API, API_KEY_NAME, parse_mapping_weights
+
+
+@pytest.fixture()
+def client():
+    # not used as a context manager, so the startup event that
+    # connects to a real database doesn't run
+    client = TestClient(app)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def init_svc():
+    ingest_db = MongoClient().ingest_db
+    init_ingest_service(ingest_db)
+    init_api_service(ingest_db)
+
+
+@pytest.fixture()
+def key():
+    return create_api_client("user1", "sirius_cybernetics_gpp", INGEST_JOBS_API)
+
+
+def test_create_job_api(client: TestClient, key):
+    request = CreateJobRequest(
+        file_path="/foo/bar.hdf5",
+        mapping_name="beamline_mappings",
+        ingest_types=[IngestType.databroker, IngestType.scicat],
+    )
+    response: CreateJobResponse = client.post(
+        url="/api/ingest/jobs", json=request.dict(), headers={API_KEY_NAME: key}
+    )
+    assert response.status_code == 200, f"failed with message {response.content}"
+    job_id = response.json()["job_id"]
+
+    response = client.get(url="/api/ingest/jobs/" + job_id)
+    assert response.status_code == 403, "ingest jobs wihtout api key"
+
+    response = client.get(
+        url="/api/ingest/jobs/" + job_id + "?" + API_KEY_NAME + "=" + key
+    )
+    job = Job(**response.json())
+    assert job.document_path == "/foo/bar.hdf5"
+
+
+def test_job_not_found(client: TestClient, key):
+    response = client.get(
+        url="/api/ingest/jobs/BAD_ID" + "?" + API_KEY_NAME + "=" + key
+    )
+    assert response.status_code == 404, "404 with unknown job id"
+
+
+def test_bad_key(client: TestClient):
+    response = client.get(url="/api/ingest/jobs", headers={API_KEY_NAME: "foo.bar"})
+    assert response.status_code == 403
+
+
+def test_create_jobs_batch(client: TestClient, key):
+    jobs = [
+        {
+            "file_path": f"/foo/bar_{x}.hdf5",
+            "mapping_name": "beamline_mappings",
+            "ingest_types": ["scicat"],
+        }
+        for x in range(3)
+    ]
+    response = client.post(
+        url="/api/ingest/jobs/batch", json={"jobs": jobs}, headers={API_KEY_NAME: key}
+    )
+    assert response.status_code == 200, f"failed with message {response.content}"
+    results = response.json()["results"]
+    assert len(results) == 3
+    for x, result in enumerate(results):
+        assert result["error"] is None
+        response = client.get(
+            url="/api/ingest/jobs/" + result["job_id"], headers={API_KEY_NAME: key}
+        )
+        assert Job(**response.json()).document_path == f"/foo/bar_{x}.hdf5"
+
+
+def test_create_job_coalesced(client: TestClient, key, tmp_path):
+    data_file = tmp_path / "scan.hdf5"
+    data_file.write_bytes(b"forty two")
+    request = {
+        "file_path": str(data_file),
+        "mapping_name": "beamline_mappings",
+        "ingest_types": ["scicat"],
+        "dedup": "file",
+    }
+    response = client.post(
+        url="/api/ingest/jobs", json=request, headers={API_KEY_NAME: key}
+    )
+    assert response.status_code == 200, f"failed with message {response.content}"
+    assert not response.json()["coalesced"]
+    job_id = response.json()["job_id"]
+
+    response = client.post(
+        url="/api/ingest/jobs/batch",
+        json={"jobs": [request, {**request, "dedup": "none"}]},
+        headers={API_KEY_NAME: key},
+    )
+    results = response.json()["results"]
+    assert results[0]["coalesced"] and results[0]["job_id"] == job_id
+    assert not results[1]["coalesced"] and results[1]["job_id"] != job_id
+
+
+def test_content_dedup_off_db_threads(client: TestClient, key, tmp_path, monkeypatch):
+    hashing_threads = []
+
+    def recording_file_dedup_key(*args):
+        hashing_threads.append(threading.current_thread().name)
+        return file_dedup_key(*args)
+
+    monkeypatch.setattr(api, "file_dedup_key", recording_file_dedup_key)
+    data_files = [tmp_path / f"scan_{x}.hdf5" for x in range(3)]
+    for data_file in data_files:
+        data_file.write_bytes(b"forty two")
+    jobs = [
+        {
+            "file_path": str(data_file),
+            "mapping_name": "beamline_mappings",
+            "ingest_types": ["scicat"],
+            "dedup": "content",
+        }
+        for data_file in data_files
+    ]
+    response = client.post(
+        url="/api/ingest/jobs/batch", json={"jobs": jobs}, headers={API_KEY_NAME: key}
+    )
+    results = response.json()["results"]
+    assert [result["coalesced"] for result in results] == [False, True, True]
+    assert len(hashing_threads) == 3
+    assert all(name.startswith("file") for name in hashing_threads)
+
+
+def test_job_priority(client: TestClient, key):
+    request = {
+        "file_path": "/foo/urgent.hdf5",
+        "mapping_name": "beamline_mappings",
+        "ingest_types": ["scicat"],
+        "priority": 10,
+    }
+    response = client.post(
+        url="/api/ingest/jobs", json=request, headers={API_KEY_NAME: key}
+    )
+    job_id = response.json()["job_id"]
+    response = client.get(url="/api/ingest/jobs/" + job_id, headers={API_KEY_NAME: key})
+    assert response.json()["priority"] == 10
+    response = client.post(
+        url="/api/ingest/jobs",
+        json={**request, "priority": 11},
+        headers={API_KEY_NAME: key},
+    )
+    assert response.status_code == 422
+
+
+def test_parse_mapping_weights():
+    assert parse_mapping_weights(["live=4", " backfill=0.25"]) == {
+        "live": 4.0,
+        "backfill": 0.25,
+    }
+
+
+def test_query_jobs_api(client: TestClient, key):
+    response = client.get(
+        url="/api/ingest/jobs/query",
+        params={"status": ["submitted", "running"], "limit": 1},
+        headers={API_KEY_NAME: key},
+    )
+    assert response.status_code == 200, f"failed with message {response.content}"
+    response = client.get(
+        url="/api/ingest/jobs/query",
+        params={"cursor": "not_a_cursor"},
+        headers={API_KEY_NAME: key},
+    )
+    assert response.status_code == 400
+
+
+def test_job_events(client: TestClient, key):
+    job = create_job("user1", "/foo/events.hdf5", "magrathia", [IngestType.scicat])
+    finished_time = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    set_job_status(
+        job.id,
+        StatusItem(
+            time=finished_time,
+            submitter="system",
+            status=JobStatus.successful,
+            log="so long",
+        ),
+    )
+    response = client.get(
+        url=f"/api/ingest/jobs/{job.id}/events", headers={API_KEY_NAME: key}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [event for event in response.text.split("\n\n") if event.startswith("id:")]
+    assert len(events) == 2, "submitted and successful statuses streamed"
+    assert "so long" in events[-1]
+    assert response.text.rstrip().endswith("data: finished")
+
+    assert [event.partition("\n")[0] for event in events] == ["id: 0", "id: 1"]
+
+    # resumes after the last event the client saw
+    response = client.get(
+        url=f"/api/ingest/jobs/{job.id}/events",
+        headers={API_KEY_NAME: key, "Last-Event-ID": "0"},
+    )
+    assert response.text.count("event: status") == 1
+    assert "so long" in response.text
+
+    response = client.get(
+        url=f"/api/ingest/jobs/{job.id}/events",
+        headers={API_KEY_NAME: key, "Last-Event-ID": job.submit_time.isoformat()},
+    )
+    assert response.status_code == 400
+
+    response = client.get(
+        url="/api/ingest/jobs/BAD_ID/events", headers={API_KEY_NAME: key}
+    )
+    assert response.status_code == 404
+
+
+def test_job_watcher_one_query_per_poll(monkeypatch):
+    jobs = [
+        create_job("user1", f"/foo/watch_{x}.hdf5", "magrathia", [IngestType.scicat])
+        for x in range(3)
+    ]
+    queries = []
+
+    def counting_find_modified_times(job_ids):
+        queries.append(sorted(job_ids))
+        return find_modified_times(job_ids)
+
+    monkeypatch.setattr(api, "find_modified_times", counting_find_modified_times)
+
+    async def watch():
+        watcher = api.JobStatusWatcher(0.01)
+        changed = {job.id: watcher.watch(job.id) for job in jobs}
+        await asyncio.sleep(0.05)
+        for event in changed.values():
+            event.clear()
+        queries.clear()
+
+        set_job_status(
+            jobs[1].id,
+            StatusItem(
+                time=datetime.datetime.utcnow(),
+                submitter="system",
+                status=JobStatus.running,
+            ),
+        )
+        await asyncio.wait_for(changed[jobs[1].id].wait(), 1)
+        assert not changed[jobs[0].id].is_set(), "unchanged jobs don't wake"
+        assert not changed[jobs[2].id].is_set()
+        for job in jobs:
+            watcher.unwatch(job.id, changed[job.id])
+        await asyncio.sleep(0.05)
+
+    asyncio.run(watch())
+    assert queries, "jobs checked while watched"
+    assert all(
+        job_ids == sorted(job.id for job in jobs) for job_ids in queries[:-1]
+    ), "every watched job in one query"
+
+
+def _utcnow_millis():
+    now = datetime.datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def test_job_statuses(client: TestClient, key, monkeypatch):
+    # compare watermarks exactly, the margin is tested below
+    monkeypatch.setattr(ingest_service, "WATERMARK_MARGIN", datetime.timedelta(0))
+    # mongo stores dates to the millisecond, mongomock's $currentDate doesn't
+    monkeypatch.setattr(mongomock, "utcnow", _utcnow_millis)
+    jobs = [
+        create_job("user1", f"/foo/{x}.hdf5", "magrathia", [IngestType.scicat])
+        for x in range(3)
+    ]
+    request = {"job_ids": [job.id for job in jobs] + ["BAD_ID"]}
+    response = client.post(
+        url="/api/ingest/jobs/status", json=request, headers={API_KEY_NAME: key}
+    )
+    assert response.status_code == 200, f"failed with message {response.content}"
+    statuses = response.json()
+    assert {job["id"] for job in statuses["jobs"]} == {job.id for job in jobs}
+    assert all(job["status"] == "submitted" for job in statuses["jobs"])
+    assert all(job["last_status"] is None for job in statuses["jobs"])
+    assert statuses["missing"] == ["BAD_ID"]
+    etag = response.headers["ETag"]
+
+    response = client.post(
+        url="/api/ingest/jobs/status",
+        json=request,
+        headers={API_KEY_NAME: key, "If-None-Match": etag},
+    )
+    assert response.status_code == 304, "unchanged batch by etag"
+    response = client.post(
+        url="/api/ingest/jobs/status",
+        json={**request, "modified_since": statuses["watermark"]},
+        headers={API_KEY_NAME: key},
+    )
+    assert response.status_code == 304, "unchanged batch by watermark"
+
+    set_job_status(
+        jobs[1].id,
+        StatusItem(
+            time=datetime.datetime.utcnow() + datetime.timedelta(seconds=1),
+            submitter="system",
+            status=JobStatus.running,
+        ),
+    )
+    response = client.post(
+        url="/api/ingest/jobs/status",
+        json={
+            **request,
+            "modified_since": statuses["watermark"],
+            "include_last_status": True,
+        },
+        headers={API_KEY_NAME: key, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    changed = {job["id"]: job for job in response.json()["jobs"]}[jobs[1].id]
+    assert changed["status"] == "running"
+    assert changed["last_status"]["status"] == "running"
+
+
+def test_job_statuses_write_landing_after_watermark(client: TestClient, key):
+    jobs = [
+        create_job("user1", f"/foo/late_{x}.hdf5", "magrathia", [IngestType.scicat])
+        for x in range(2)
+    ]
+    request = {"job_ids": [job.id for job in jobs]}
+    response = client.post(
+        url="/api/ingest/jobs/status", json=request, headers={API_KEY_NAME: key}
+    )
+    watermark = datetime.datetime.fromisoformat(response.json()["watermark"])
+
+    # stamped before the watermark was read, but only visible after
+    ingest_service.service_context.ingest_jobs.update_one(
+        {"id": jobs[0].id},
+        {
+            "$set": {
+                "status": JobStatus.running,
+                "modified_time": watermark - datetime.timedelta(milliseconds=500),
+            }
+        },
+    )
+    response = client.post(
+        url="/api/ingest/jobs/status",
+        json={**request, "modified_since": watermark.isoformat()},
+        headers={API_KEY_NAME: key},
+    )
+    assert response.status_code == 200, "late landing write not missed"
+    statuses = {job["id"]: job["status"] for job in response.json()["jobs"]}
+    assert statuses[jobs[0].id] == "running"
+
+
+def test_pollers(client: TestClient, key):
+    report_poller_stats(PollBackoff("api_test_worker", 5, 60).stats())
+    response = client.get(url="/api/ingest/pollers", headers={API_KEY_NAME: key})
+    assert response.status_code == 200
+    pollers = {poller["worker_id"]: poller for poller in response.json()}
+    assert pollers["api_test_worker"]["current_interval"] == 5
+
+
+def test_key_cache_counts_each_request_once(client: TestClient, key):
+    # a fresh service, so the key isn't cached yet
+    init_api_service(MongoClient().ingest_db)
+    key = create_api_client("user1", "sirius_cybernetics_gpp", INGEST_JOBS_API)
+    for _ in range(2):
+        response = client.get(
+            url="/api/ingest/jobs/BAD_ID", headers={API_KEY_NAME: key}
+        )
+        assert response.status_code == 404
+    stats = api_auth_context.verified_keys.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
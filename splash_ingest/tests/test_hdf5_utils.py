@@ -0,0 +1,143 @@
+import h5py
+import numpy as np
+import pytest
+
+from splash_ingest.ingestors.hdf5_utils import (
+    extract_metadata,
+    sample_dataset,
+)
+
+
+@pytest.fixture
+def tomo_file(tmp_path):
+    file = h5py.File(tmp_path / "tomo.hdf5", "w")
+    file.create_dataset("/measurement/sample/file_name", data=b"scan_1", dtype="|S256")
+    file.create_dataset(
+        "/measurement/sample/experiment/pi", data=b"Ford", dtype="|S256"
+    )
+    file.create_dataset("/measurement/instrument/detector/binning_x", data=[2])
+    yield file
+    file.close()
+
+
+def test_extract_metadata(tomo_file):
+    issues = []
+    scicat_metadata, scientific_metadata = extract_metadata(
+        tomo_file,
+        [
+            [
+                "/measurement/sample/file_name",
+                "/measurement/sample/experiment/pi",
+                "/measurement/sample/experiment/proposal",
+            ],
+            [
+                "/measurement/instrument/detector/binning_x",
+                "/measurement/sample/file_name",
+                "/process/acquisition/name",
+                "/process/acquisition/name",
+            ],
+        ],
+        issues,
+    )
+    assert scicat_metadata == {
+        "/measurement/sample/file_name": "scan_1",
+        "/measurement/sample/experiment/pi": "Ford",
+    }
+    assert scientific_metadata == {
+        "/measurement/instrument/detector/binning_x": 2,
+        "/measurement/sample/file_name": "scan_1",
+    }
+    assert [issue.msg for issue in issues] == [
+        "dataset not found /measurement/sample/experiment/proposal",
+        "dataset not found /process/acquisition/name",
+        "dataset not found /process/acquisition/name",
+    ], "same issues, in the same order, as reading each list on its own"
+
+
+def test_extract_metadata_resolves_groups_once(tomo_file, monkeypatch):
+    lookups = []
+    group_get = h5py.Group.get
+
+    def counting_get(self, name, *args, **kwargs):
+        lookups.append(name)
+        return group_get(self, name, *args, **kwargs)
+
+    monkeypatch.setattr(h5py.Group, "get", counting_get)
+    extract_metadata(
+        tomo_file,
+        [
+            ["/measurement/sample/file_name", "/measurement/sample/experiment/pi"],
+            ["/measurement/sample/file_name"],
+        ],
+        [],
+    )
+    assert lookups == ["measurement", "sample", "file_name", "experiment", "pi"]
+
+
+def test_extract_metadata_readers(tmp_path):
+    keys = ["/measurement/sample/experiment/pi", "/measurement/sample/energy"]
+    strings = {"dtype": "|S256"}
+
+    def extract(name, pi, energy, pi_kwargs=strings, **energy_kwargs):
+        with h5py.File(tmp_path / name, "w") as file:
+            file.create_dataset(keys[0], data=pi, **pi_kwargs)
+            file.create_dataset(keys[1], data=energy, **energy_kwargs)
+        with h5py.File(tmp_path / name, "r") as file:
+            return extract_metadata(file, [keys], [])[0]
+
+    assert extract("1.h5", b"Ford", [20.0], maxshape=(1,)) == {
+        keys[0]: "Ford",
+        keys[1]: 20.0,
+    }
+
+    metadata = extract("2.h5", 42, [20.0, 30.0], pi_kwargs={})
+    assert metadata[keys[0]] == 42
+    assert list(metadata[keys[1]]) == [20.0, 30.0]
+
+    # extendable datasets of one value stay arrays
+    metadata = extract("3.h5", b"Ford", [20.0], maxshape=(None,), chunks=True)
+    assert list(metadata[keys[1]]) == [20.0]
+
+
+def test_extract_metadata_of_a_group(tomo_file):
+    issues = []
+    metadata = extract_metadata(
+        tomo_file,
+        [["/measurement/sample/experiment", "/measurement/sample/file_name"]],
+        issues,
+    )[0]
+    assert metadata == {
+        "/measurement/sample/experiment": None,
+        "/measurement/sample/file_name": "scan_1",
+    }
+    assert [issue.msg for issue in issues] == [
+        "not a dataset /measurement/sample/experiment"
+    ]
+
+
+def test_sample_dataset_reads_only_sampled_chunks(tmp_path):
+    with h5py.File(tmp_path / "series.h5", "w") as file:
+        file.create_dataset(
+            "series", data=np.arange(100_000.0), chunks=(1000,), compression="gzip"
+        )
+        file.create_dataset("images", data=np.ones((50, 4, 4)), chunks=(10, 2, 4))
+        file.create_dataset("contiguous", data=np.arange(25))
+    with h5py.File(tmp_path / "series.h5", "r") as file:
+        series = file["series"]
+        sample, bytes_read = sample_dataset(series, 10)
+        assert list(sample) == list(series[0::10_000])
+        # one chunk of the hundred for each sample
+        assert 0 < bytes_read < series.id.get_storage_size() / 5
+
+        # a sample in every chunk reads them all
+        sample, bytes_read = sample_dataset(series, 1000)
+        assert list(sample) == list(series[0::100])
+        assert bytes_read == series.id.get_storage_size()
+
+        sample, bytes_read = sample_dataset(file["images"], 5)
+        assert sample.shape == (5, 4, 4)
+        assert bytes_read == 5 * 2 * 10 * 2 * 4 * 8
+
+        sample, bytes_read = sample_dataset(file["contiguous"], 10)
+        assert list(sample) == list(range(0, 25, 2))
+        assert bytes_read == sample.nbytes
@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pytest
+
+from splash_ingest.ingestors.mapping_ingestor import load_plan, MappingIngestor
+
+MAPPING_832 = Path(__file__).parents[2] / "mappings" / "832Mapping.json"
+
+
+class FakeScicatClient:
+    def __init__(self):
+        self.datasets = []
+        self.datablocks = []
+        self.attachments = []
+
+    def upload_raw_dataset(self, dataset):
+        self.datasets.append(dataset)
+        return "dataset_42"
+
+    def upload_datablock(self, datablock):
+        self.datablocks.append(datablock)
+
+    def upload_attachment(self, attachment):
+        self.attachments.append(attachment)
+
+
+@pytest.fixture
+def mapping_file(tmp_path):
+    mapping = json.loads(MAPPING_832.read_text())
+    mapping_file = tmp_path / "mapping.json"
+    mapping_file.write_text(json.dumps(mapping))
+    return mapping_file
+
+
+def test_compile_832_mapping():
+    plan = load_plan(MAPPING_832)
+    assert plan.name == "als832_dx_3"
+    assert plan.thumbnail_field == "/exchange/data"
+    assert "/exchange/data" not in plan.sample_keys, "external fields not sampled"
+    assert len(plan.sample_keys) == len(set(plan.sample_keys))
+    assert plan.scientific_keys.count("/process/acquisition/rotation/blur_limit") == 1
+    assert "/measurement/sample/experiment/beamline" in plan.metadata_keys
+    assert load_plan(MAPPING_832) is plan, "compiled once"
+
+
+def test_plan_recompiled_for_new_version(mapping_file):
+    plan = load_plan(mapping_file)
+    mapping = json.loads(mapping_file.read_text())
+    mapping["version"] = "2"
+    mapping_file.write_text(json.dumps(mapping))
+    new_plan = load_plan(mapping_file)
+    assert new_plan is not plan
+    assert new_plan.version == "2"
+
+
+def test_mapping_ingestor(mapping_file, tmp_path):
+    data_file = tmp_path / "scan.h5"
+    with h5py.File(data_file, "w") as file:
+        file.create_dataset(
+            "/measurement/sample/file_name", data=b"scan_1", dtype="|S256"
+        )
+        file.create_dataset(
+            "/measurement/sample/experiment/pi", data=b"Ford", dtype="|S256"
+        )
+        file.create_dataset(
+            "/measurement/sample/experiment/beamline", data=b"bl832", dtype="|S256"
+        )
+        file.create_dataset("/measurement/instrument/detector/binning_x", data=[2])
+        file.create_dataset(
+            "/measurement/instrument/source/current", data=np.arange(100.0)
+        )
+        file.create_dataset("/exchange/data", data=np.random.rand(2, 8, 8))
+
+    ingestor = MappingIngestor(mapping_file)
+    assert ingestor.ingest_spec == "als832_dx_3"
+    scicat_client = FakeScicatClient()
+    issues = []
+    dataset_id = ingestor.ingest(
+        scicat_client, "ingest_user", str(data_file), tmp_path, issues
+    )
+    assert dataset_id == "dataset_42"
+    dataset = scicat_client.datasets[0]
+    assert dataset.datasetName == "scan_1"
+    assert dataset.principalInvestigator == "Ford"
+    assert dataset.contactEmail == "Unknown"
+    assert dataset.dataFormat == "DX"
+    assert "bl832" in dataset.accessGroups
+    scientific_metadata = dataset.scientificMetadata
+    assert scientific_metadata["/measurement/instrument/detector/binning_x"] == 2
+    assert (
+        len(
+            scientific_metadata["data_sample"]["/measurement/instrument/source/current"]
+        )
+        == 10
+    )
+    assert scicat_client.datablocks and scicat_client.attachments
+    assert scicat_client.attachments[0].thumbnail.startswith("data:image/png;base64,")
+    assert "dataset not found /measurement/sample/experimenter/email" in [
+        issue.msg for issue in issues
+    ]
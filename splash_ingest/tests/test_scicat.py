@@ -1,13 +1,21 @@
+import base64
 import h5py
+import io
 import json
 import numpy as np
+import os
+from PIL import Image
 import pytest
 
+from splash_ingest.ingestors import scicat_utils
 from splash_ingest.ingestors.scicat_utils import NPArrayEncoder
 
 from splash_ingest.ingestors.scicat_utils import (
     build_search_terms,
     calculate_access_controls,
+    create_thumbnail,
+    read_thumbnail_frame,
+    ThumbnailCache,
 )
 
 
@@ -91,3 +99,53 @@ def test_access_controls():
     assert access_controls["owner_group"] == "42"
     assert "8.3.2" in access_controls["access_groups"]
     assert "bl832" in access_controls["access_groups"]
+
+
+@pytest.fixture
+def image_stack(tmp_path):
+    file_path = tmp_path / "stack.hdf5"
+    with h5py.File(file_path, "w") as file:
+        file.create_dataset(
+            "/exchange/data",
+            data=np.arange(2 * 1100 * 600, dtype=np.uint16).reshape(2, 1100, 600),
+        )
+    file = h5py.File(file_path, "r")
+    yield file_path, file["/exchange/data"]
+    file.close()
+
+
+def test_read_thumbnail_frame(image_stack):
+    _, data_set = image_stack
+    frame = read_thumbnail_frame(data_set)
+    assert frame.dtype == np.float32
+    assert frame.shape == (367, 300)
+    np.testing.assert_array_equal(frame, data_set[0, ::3, ::2])
+    assert read_thumbnail_frame(data_set) is frame, "buffer reused"
+
+
+def test_create_thumbnail(image_stack, tmp_path, monkeypatch):
+    file_path, data_set = image_stack
+    thumbnail = create_thumbnail(data_set, file_path)
+    header, data = thumbnail.split(",")
+    assert header == "data:image/png;base64"
+    image = Image.open(io.BytesIO(base64.b64decode(data)))
+    assert image.format == "PNG"
+    assert image.size == (300, 367)
+
+    thumbs_dir = tmp_path / "thumbs"
+    assert create_thumbnail(data_set, file_path, thumbs_dir) == thumbnail
+    assert len(list(thumbs_dir.glob("*.png"))) == 1
+    monkeypatch.setattr(scicat_utils, "build_thumbnail", None)
+    assert create_thumbnail(data_set, file_path, thumbs_dir) == thumbnail, "cached"
+
+
+def test_thumbnail_cache_bounded(tmp_path):
+    cache = ThumbnailCache(tmp_path, max_files=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, key.encode())
+        os.utime(tmp_path / f"{key}.png", (0, ord(key)))
+    cache.put("d", b"d")
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.get("c") == b"c"
+    assert cache.get("d") == b"d"
@@ -0,0 +1,21 @@
+import time
+
+from splash_ingest.ingestors.utils import StageTimer, stage
+
+
+def test_stage_timer():
+    stage_timer = StageTimer()
+    with stage("not_recorded"):
+        pass
+    with stage_timer.activate():
+        with stage("sleep"):
+            time.sleep(0.02)
+        with stage("compute"):
+            sum(range(100000))
+    with stage("after"):
+        pass
+    assert [timing.name for timing in stage_timer.timings] == ["sleep", "compute"]
+    sleep_timing = stage_timer.timings[0]
+    assert sleep_timing.wall_seconds >= 0.02
+    assert sleep_timing.cpu_seconds < sleep_timing.wall_seconds, "sleeping is not cpu"
+    assert stage_timer.summary().startswith("sleep: ")